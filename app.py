@@ -8,15 +8,30 @@ from __future__ import annotations
 import base64
 import io
 import tempfile
+import uuid
+from collections.abc import Mapping
 from pathlib import Path
 
 import streamlit as st
 from PIL import Image
 
-from config import TOP_K
+from config import (
+    BASE_COLLECTION_NAME,
+    CHAT_PAGE_SIZE,
+    EMBED_WORKERS,
+    SNAPSHOT_DIR,
+    SNAPSHOT_EXPORT_DIR,
+    THUMBNAIL_SIZE,
+    TOP_K,
+)
 from core.embedder import CLIPEmbedder
+from core.embedding_pool import EmbeddingPool
+from core.memory import MemoryBudgetExceeded
 from core.pdf_processor import PDFProcessor
 from core.retriever import MultimodalRetriever
+from core.session_store import SessionStoreManager
+from core.sharded_store import ShardedVectorStore
+from core.snapshot import export_snapshot, load_base_corpus
 from core.vector_store import ChromaVectorStore
 
 # ── Page config ───────────────────────────────────────────────────────────────
@@ -246,17 +261,76 @@ html, body, [class*="css"] { font-family: 'DM Sans', sans-serif; }
 
 # ── Cached resources ──────────────────────────────────────────────────────────
 @st.cache_resource(show_spinner=False)
-def get_embedder() -> CLIPEmbedder:
+def get_embedder() -> CLIPEmbedder | EmbeddingPool:
+    if EMBED_WORKERS > 0:
+        return EmbeddingPool()
     return CLIPEmbedder()
 
 @st.cache_resource(show_spinner=False)
-def get_vector_store() -> ChromaVectorStore:
+def get_session_manager() -> SessionStoreManager:
     embedder = get_embedder()
-    return ChromaVectorStore(embedding_dim=embedder.embedding_dimension())
+    return SessionStoreManager(embedding_dim=embedder.embedding_dimension())
+
+def get_vector_store(create: bool = True) -> ChromaVectorStore | ShardedVectorStore | None:
+    """Return this browser session's own collection (``None`` once expired)."""
+    return get_session_manager().get(st.session_state.session_id, create=create)
+
+
+@st.cache_resource(show_spinner="Loading the shared corpus…")
+def get_base_corpus() -> tuple[ChromaVectorStore | ShardedVectorStore, dict[str, str]] | None:
+    """The read-only corpus from ``SNAPSHOT_DIR``, imported once per process."""
+    if not SNAPSHOT_DIR or not (Path(SNAPSHOT_DIR) / "manifest.json").exists():
+        return None
+    store = get_session_manager().open_shared(BASE_COLLECTION_NAME)
+    return store, load_base_corpus(store, SNAPSHOT_DIR)
+
+def bind_retriever(
+    vector_store: ChromaVectorStore | ShardedVectorStore,
+    image_data_store: Mapping[str, str],
+    doc_name: str,
+    top_k: int,
+    source: str = "session",
+) -> None:
+    """Point the chat at freshly indexed content or the shared corpus."""
+    if st.session_state.retriever is not None:
+        st.session_state.retriever.close()
+    st.session_state.retriever = MultimodalRetriever(
+        embedder=get_embedder(),
+        vector_store=vector_store,
+        image_data_store=image_data_store,
+        top_k=top_k,
+    )
+    st.session_state.indexed = True
+    st.session_state.chat_history = []
+    st.session_state.thumbnails = {}
+    st.session_state.history_pages = 1
+    st.session_state.chunk_count = vector_store.count()
+    st.session_state.doc_name = doc_name
+    st.session_state.index_source = source
+
+
+def get_thumbnail(image_id: str) -> bytes | None:
+    """Small JPEG for the transcript, built once per image and session.
+
+    Passing bytes to ``st.image`` lets Streamlit serve them by URL from its
+    media cache instead of inlining base64 into every rerun.
+    """
+    thumbnails: dict[str, bytes] = st.session_state.thumbnails
+    if image_id not in thumbnails:
+        image_b64 = st.session_state.retriever.image_data_store.get(image_id)
+        if not image_b64:
+            return None
+        img = Image.open(io.BytesIO(base64.b64decode(image_b64))).convert("RGB")
+        img.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        buffered = io.BytesIO()
+        img.save(buffered, format="JPEG", quality=80)
+        thumbnails[image_id] = buffered.getvalue()
+    return thumbnails[image_id]
 
 
 # ── Session state ─────────────────────────────────────────────────────────────
 for key, default in [
+    ("session_id", uuid.uuid4().hex),
     ("indexed", False),
     ("processor", None),
     ("retriever", None),
@@ -267,10 +341,24 @@ for key, default in [
     ("input_mode", "Both"),
     ("uploaded_image_b64", None),
     ("uploaded_image_name", ""),
+    ("thumbnails", {}),
+    ("history_pages", 1),
+    ("index_source", "session"),  # "session" collection or the shared "base" corpus
 ]:
     if key not in st.session_state:
         st.session_state[key] = default
 
+# Idle sessions are evicted server-side; drop stale state so the user re-indexes.
+# The lookup also refreshes the idle timer, but never recreates the collection.
+if st.session_state.indexed and st.session_state.index_source == "session":
+    if get_vector_store(create=False) is None:
+        st.session_state.indexed = False
+        if st.session_state.retriever is not None:
+            st.session_state.retriever.close()
+        st.session_state.retriever = None
+        st.session_state.chat_history = []
+        st.toast("Your session expired — please index your content again.")
+
 
 # ── Sidebar ───────────────────────────────────────────────────────────────────
 with st.sidebar:
@@ -301,6 +389,7 @@ with st.sidebar:
                 st.session_state.input_mode = label
                 st.session_state.indexed = False
                 st.session_state.chat_history = []
+                st.session_state.thumbnails = {}
                 st.session_state.uploaded_image_b64 = None
                 st.rerun()
 
@@ -345,15 +434,37 @@ with st.sidebar:
     )
     index_btn = st.button(btn_labels[mode], disabled=not can_index, use_container_width=True)
 
+    # ── Shared corpus / export (operator-configured paths only) ───────────────
+    base_corpus = get_base_corpus()
+    base_btn = False
+    if base_corpus is not None:
+        base_btn = st.button("✦  Use Shared Corpus", use_container_width=True)
+    export_btn = False
+    if SNAPSHOT_EXPORT_DIR and st.session_state.index_source == "session":
+        export_btn = st.button(
+            "Export Snapshot", use_container_width=True, disabled=not st.session_state.indexed
+        )
+
     if st.session_state.indexed:
         st.markdown('<div class="divider"></div>', unsafe_allow_html=True)
         mode_pill = {"Text": "📝 Text", "Image": "🖼️ Image", "Both": "✦ Both"}[mode]
+        ingest_stats = (
+            st.session_state.processor.last_ingest_stats
+            if st.session_state.processor is not None and st.session_state.index_source == "session"
+            else None
+        )
+        memory_pill = (
+            f'<span class="stat-pill" title="{ingest_stats.summary()}">'
+            f"🧠 {ingest_stats.peak_rss_mb:.0f} MB peak</span>"
+            if ingest_stats is not None else ""
+        )
         st.markdown(f"""
         <div style="padding: 0 1rem;">
             <div class="stats-row">
                 <span class="stat-pill">{mode_pill}</span>
                 <span class="stat-pill">📄 {st.session_state.doc_name[:16]}</span>
                 <span class="stat-pill">🗂 {st.session_state.chunk_count} chunks</span>
+                {memory_pill}
             </div>
         </div>
         """, unsafe_allow_html=True)
@@ -368,27 +479,21 @@ if index_btn and can_index:
     ph.markdown('<div style="text-align:center;padding:2rem;color:rgba(255,255,255,0.4);font-size:0.85rem;">✦ Processing…</div>', unsafe_allow_html=True)
 
     doc_name = ""
-    chunk_count = 0
     processor = PDFProcessor(embedder=embedder, vector_store=vector_store)
 
     # ── TEXT mode: index plain .txt file ─────────────────────────────────────
     if mode == "Text" and uploaded_txt is not None:
-        from langchain_core.documents import Document as LCDocument
-        from langchain_text_splitters import RecursiveCharacterTextSplitter
-
-        text_content = uploaded_txt.read().decode("utf-8", errors="ignore")
-        splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=100)
-        chunks = splitter.create_documents(
-            [text_content],
-            metadatas=[{"page": 0, "type": "text"}],
-        )
-        vector_store.clear()
-        embeddings = [embedder.embed_text(c.page_content) for c in chunks]
-        vector_store.add_documents(chunks, embeddings)
+        try:
+            processor.process_text_file(uploaded_txt, doc_id=uploaded_txt.name)
+        except MemoryBudgetExceeded as exc:
+            # The session's collection was cleared before the ingest started
+            st.session_state.indexed = False
+            ph.empty()
+            st.error(str(exc))
+            st.stop()
 
         st.session_state.processor = processor
         doc_name = uploaded_txt.name
-        chunk_count = vector_store.count()
 
     # ── IMAGE mode: embed standalone image ────────────────────────────────────
     elif mode == "Image" and uploaded_image is not None:
@@ -407,7 +512,7 @@ if index_btn and can_index:
         img_embedding = embedder.embed_image(pil_img)
         img_doc = LCDocument(
             page_content=f"[Image: {img_id}]",
-            metadata={"page": 0, "type": "image", "image_id": img_id},
+            metadata={"page": 0, "type": "image", "image_id": img_id, "doc_id": uploaded_image.name},
         )
         processor.image_data_store = {img_id: img_b64}
         vector_store.clear()
@@ -415,33 +520,44 @@ if index_btn and can_index:
 
         st.session_state.processor = processor
         doc_name = uploaded_image.name
-        chunk_count = vector_store.count()
 
     # ── BOTH mode: full PDF (text + embedded images) ──────────────────────────
     elif mode == "Both" and uploaded_file is not None:
         with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
             tmp.write(uploaded_file.read())
             tmp_path = Path(tmp.name)
-        processor.process(tmp_path)
+        try:
+            processor.process(tmp_path, doc_id=uploaded_file.name)
+        except MemoryBudgetExceeded as exc:
+            # The session's collection was cleared before the ingest started
+            st.session_state.indexed = False
+            ph.empty()
+            st.error(str(exc))
+            st.stop()
 
         st.session_state.processor = processor
         doc_name = uploaded_file.name
-        chunk_count = vector_store.count()
 
     ph.empty()
 
-    st.session_state.retriever = MultimodalRetriever(
-        embedder=embedder,
-        vector_store=vector_store,
-        image_data_store=st.session_state.processor.image_data_store,
-        top_k=top_k,
-    )
-    st.session_state.indexed = True
-    st.session_state.chat_history = []
-    st.session_state.chunk_count = chunk_count
-    st.session_state.doc_name = doc_name
+    bind_retriever(vector_store, st.session_state.processor.image_data_store, doc_name, top_k)
+    st.rerun()
+
+# ── Shared corpus / snapshot export ───────────────────────────────────────────
+# The shared corpus is imported once per process and only ever read, so
+# sessions query it directly instead of copying it into their own collection
+if base_btn and base_corpus is not None:
+    base_store, base_images = base_corpus
+    bind_retriever(base_store, base_images, Path(SNAPSHOT_DIR).name, top_k, source="base")
     st.rerun()
 
+if export_btn and st.session_state.indexed:
+    retriever: MultimodalRetriever = st.session_state.retriever
+    export_path = Path(SNAPSHOT_EXPORT_DIR) / st.session_state.session_id
+    with st.spinner("Exporting snapshot…"):
+        manifest = export_snapshot(retriever.vector_store, retriever.image_data_store, export_path)
+    st.toast(f"Exported {manifest['count']} chunks")
+
 
 # ── Main area ─────────────────────────────────────────────────────────────────
 st.markdown("""
@@ -503,30 +619,56 @@ else:
     if st.session_state.input_mode in ("Image", "Both") and st.session_state.uploaded_image_b64:
         with st.expander(f"🖼️  Uploaded image — {st.session_state.uploaded_image_name}", expanded=False):
             st.markdown('<div class="img-preview-wrap">', unsafe_allow_html=True)
-            st.image(f"data:image/png;base64,{st.session_state.uploaded_image_b64}", use_column_width=True)
+            st.image(base64.b64decode(st.session_state.uploaded_image_b64), use_column_width=True)
             st.markdown('</div>', unsafe_allow_html=True)
 
     # ── Chat history ──────────────────────────────────────────────────────────
-    for turn in st.session_state.chat_history:
+    # Only the latest pages of the transcript are rendered on each rerun
+    history = st.session_state.chat_history
+    visible_count = CHAT_PAGE_SIZE * st.session_state.history_pages
+    hidden_count = max(0, len(history) - visible_count)
+    if hidden_count:
+        if st.button(f"Show earlier messages ({hidden_count} hidden)", key="show_earlier"):
+            st.session_state.history_pages += 1
+            st.rerun()
+    visible_turns = history[hidden_count:]
+
+    # Turns keep only (id, distance); fetch visible chunks in one round trip
+    hit_ids = [hit["id"] for turn in visible_turns for hit in turn.get("hits", [])]
+    docs_by_id = {
+        doc.id: doc
+        for doc in st.session_state.retriever.vector_store.get_documents(list(dict.fromkeys(hit_ids)))
+    }
+
+    degradation_notes = {
+        "trimmed_images": "images left out of the context",
+        "reduced_top_k": "fewer retrieved chunks used",
+        "excerpts_only": "showing retrieved excerpts without generation",
+    }
+    for turn in visible_turns:
         if turn["role"] == "user":
             st.markdown(f'<div class="user-card">{turn["content"]}</div>', unsafe_allow_html=True)
         else:
             with st.chat_message("assistant"):
                 st.markdown(f'<div class="answer-card">{turn["content"]}</div>', unsafe_allow_html=True)
-                if turn.get("docs"):
-                    with st.expander(f"  {len(turn['docs'])} retrieved chunks"):
-                        for doc in turn["docs"]:
+                if turn.get("degradation", "none") != "none":
+                    st.caption(f"⏱ Answered under time pressure · {degradation_notes[turn['degradation']]}")
+                if turn.get("hits"):
+                    with st.expander(f"  {len(turn['hits'])} retrieved chunks"):
+                        for hit in turn["hits"]:
+                            doc = docs_by_id.get(hit["id"])
+                            if doc is None:
+                                continue
                             doc_type = doc.metadata.get("type", "unknown")
                             page = doc.metadata.get("page", "?")
                             if doc_type == "text":
                                 preview = doc.page_content[:220] + "…" if len(doc.page_content) > 220 else doc.page_content
                                 st.markdown(f'<div class="chunk-item"><div class="chunk-label">Text · Page {page}</div>{preview}</div>', unsafe_allow_html=True)
                             else:
-                                image_id = doc.metadata.get("image_id", "")
-                                image_b64 = st.session_state.retriever.image_data_store.get(image_id)
+                                thumbnail = get_thumbnail(doc.metadata.get("image_id", ""))
                                 st.markdown(f'<div class="chunk-label">Image · Page {page}</div>', unsafe_allow_html=True)
-                                if image_b64:
-                                    st.image(f"data:image/png;base64,{image_b64}", use_column_width=True)
+                                if thumbnail:
+                                    st.image(thumbnail)
 
     # ── Chat input ────────────────────────────────────────────────────────────
     placeholders = {
@@ -544,7 +686,12 @@ else:
 
         with st.spinner(""):
             retriever: MultimodalRetriever = st.session_state.retriever
-            answer, docs = retriever.answer(query)
-
-        st.session_state.chat_history.append({"role": "assistant", "content": answer, "docs": docs})
+            answer, docs, degradation = retriever.answer(query)
+
+        st.session_state.chat_history.append({
+            "role": "assistant",
+            "content": answer,
+            "hits": [{"id": d.id, "distance": d.distance} for d in docs],
+            "degradation": degradation,
+        })
         st.rerun()
\ No newline at end of file
@@ -13,17 +13,108 @@ OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY", "")
 OPENAI_API_BASE: str = os.getenv("OPENAI_API_BASE", "https://openrouter.ai/api/v1")
 LLM_MODEL: str = os.getenv("LLM_MODEL", "openai:gpt-4o")
 LLM_MAX_TOKENS: int = int(os.getenv("LLM_MAX_TOKENS", "100"))
+# Hard per-request timeout for the LLM client
+LLM_TIMEOUT_SECONDS: float = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+
+# ── Answer Deadline ───────────────────────────────────────────────────────────
+# End-to-end latency budget for one answer (0 = no deadline)
+ANSWER_DEADLINE_SECONDS: float = float(os.getenv("ANSWER_DEADLINE_SECONDS", "20"))
+# Share of the budget that query expansion + retrieval may use
+ANSWER_RETRIEVAL_SHARE: float = float(os.getenv("ANSWER_RETRIEVAL_SHARE", "0.3"))
+# Generation cost model used to decide how much context still fits
+ANSWER_BASE_SECONDS: float = float(os.getenv("ANSWER_BASE_SECONDS", "2.0"))
+ANSWER_SECONDS_PER_IMAGE: float = float(os.getenv("ANSWER_SECONDS_PER_IMAGE", "1.5"))
+ANSWER_SECONDS_PER_CHUNK: float = float(os.getenv("ANSWER_SECONDS_PER_CHUNK", "0.2"))
 
 # ── CLIP Embedding Model ──────────────────────────────────────────────────────
 CLIP_MODEL_NAME: str = os.getenv("CLIP_MODEL_NAME", "openai/clip-vit-base-patch32")
+# Worker processes for embedding (0 = embed in-process)
+EMBED_WORKERS: int = int(os.getenv("EMBED_WORKERS", "0"))
+EMBED_THREADS_PER_WORKER: int = int(os.getenv("EMBED_THREADS_PER_WORKER", "4"))
+# Pool forward-pass batch when the caller gives none (also the largest shard)
+EMBED_SHARD_SIZE: int = int(os.getenv("EMBED_SHARD_SIZE", "32"))
 
 # ── ChromaDB ──────────────────────────────────────────────────────────────────
 CHROMA_PERSIST_DIR: str = os.getenv("CHROMA_PERSIST_DIR", "./chroma_db")
 CHROMA_COLLECTION_NAME: str = os.getenv("CHROMA_COLLECTION_NAME", "multimodal_rag")
+# Shared, read-only corpus imported from a snapshot and queryable by every session
+BASE_COLLECTION_NAME: str = os.getenv("BASE_COLLECTION_NAME", f"{CHROMA_COLLECTION_NAME}_base")
+# Shards per session store (one persist sub-directory each; 1 = unsharded)
+CHROMA_NUM_SHARDS: int = int(os.getenv("CHROMA_NUM_SHARDS", "1"))
+# Shard routing: "row" spreads even a single document across shards; "doc_id"
+# keeps each document on one shard, which only helps multi-document collections
+CHROMA_SHARD_KEY: str = os.getenv("CHROMA_SHARD_KEY", "row")
+# HNSW graph parameters (Chroma defaults); only applied when a collection is created
+HNSW_CONSTRUCTION_EF: int = int(os.getenv("HNSW_CONSTRUCTION_EF", "100"))
+HNSW_SEARCH_EF: int = int(os.getenv("HNSW_SEARCH_EF", "10"))
+HNSW_M: int = int(os.getenv("HNSW_M", "16"))
+
+# ── Sessions ──────────────────────────────────────────────────────────────────
+# Chroma unloads least recently used collection segments beyond this budget
+SESSION_MEMORY_LIMIT_MB: int = int(os.getenv("SESSION_MEMORY_LIMIT_MB", "2048"))
+SESSION_MAX_WARM: int = int(os.getenv("SESSION_MAX_WARM", "16"))
+SESSION_MAX_COUNT: int = int(os.getenv("SESSION_MAX_COUNT", "64"))
+SESSION_TTL_SECONDS: int = int(os.getenv("SESSION_TTL_SECONDS", "3600"))
 
 # ── Text Splitter ─────────────────────────────────────────────────────────────
 CHUNK_SIZE: int = int(os.getenv("CHUNK_SIZE", "500"))
 CHUNK_OVERLAP: int = int(os.getenv("CHUNK_OVERLAP", "100"))
+# Header/footer lines repeated across pages: "strip" (default) drops them,
+# "collapse" keeps one chunk listing all pages, "off" keeps every copy
+BOILERPLATE_MODE: str = os.getenv("BOILERPLATE_MODE", "strip")
+# Only the first/last N non-blank lines of a page are header/footer candidates
+BOILERPLATE_EDGE_LINES: int = int(os.getenv("BOILERPLATE_EDGE_LINES", "3"))
+BOILERPLATE_MIN_PAGES: int = int(os.getenv("BOILERPLATE_MIN_PAGES", "3"))
+BOILERPLATE_MIN_RATIO: float = float(os.getenv("BOILERPLATE_MIN_RATIO", "0.5"))
+
+# ── Ingestion ─────────────────────────────────────────────────────────────────
+INGEST_BATCH_SIZE: int = int(os.getenv("INGEST_BATCH_SIZE", "256"))
+INGEST_EMBED_BATCH_SIZE: int = int(os.getenv("INGEST_EMBED_BATCH_SIZE", "64"))
+# Resident-memory budget for ingestion in MB (0 = unlimited)
+INGEST_RSS_BUDGET_MB: int = int(os.getenv("INGEST_RSS_BUDGET_MB", "0"))
+INGEST_READ_BLOCK_BYTES: int = int(os.getenv("INGEST_READ_BLOCK_BYTES", str(1 << 20)))
+
+# ── Image Admission ───────────────────────────────────────────────────────────
+IMAGE_MIN_SIDE: int = int(os.getenv("IMAGE_MIN_SIDE", "32"))
+# Guards only against pathological sizes: admitted images are decoded at
+# IMAGE_DECODE_MAX_SIDE, so even 600-dpi A0 scans (~20000 px) get through
+IMAGE_MAX_SIDE: int = int(os.getenv("IMAGE_MAX_SIDE", "32768"))
+IMAGE_MIN_BYTES: int = int(os.getenv("IMAGE_MIN_BYTES", "1024"))
+IMAGE_MAX_ASPECT_RATIO: float = float(os.getenv("IMAGE_MAX_ASPECT_RATIO", "8.0"))
+IMAGE_DECODE_MAX_SIDE: int = int(os.getenv("IMAGE_DECODE_MAX_SIDE", "1024"))
 
 # ── Retrieval ─────────────────────────────────────────────────────────────────
-TOP_K: int = int(os.getenv("TOP_K", "5"))
\ No newline at end of file
+TOP_K: int = int(os.getenv("TOP_K", "5"))
+# Paraphrases / sub-questions generated per query and fused by rank (0 = off)
+QUERY_EXPANSIONS: int = int(os.getenv("QUERY_EXPANSIONS", "0"))
+# Per-modality result quotas, e.g. "text:4,image:2" (empty = single top-k query)
+MODALITY_QUOTAS: dict[str, int] = {
+    name.strip(): int(n)
+    for name, n in (
+        item.split(":") for item in os.getenv("MODALITY_QUOTAS", "").split(",") if item
+    )
+}
+
+# ── Compressed Index (IVF-PQ) ─────────────────────────────────────────────────
+# "hnsw" keeps float32 vectors in Chroma's in-RAM HNSW index; "pq" bypasses
+# Chroma: only IVF-PQ codes and int32 row numbers stay in RAM, the exact vectors
+# sit in a memory-mapped file for reranking and documents in SQLite
+# (switching modes requires re-indexing)
+VECTOR_INDEX: str = os.getenv("VECTOR_INDEX", "hnsw")
+# "pq" mode scans the exact vectors until this many are stored, then trains the index
+PQ_MIN_TRAIN_ROWS: int = int(os.getenv("PQ_MIN_TRAIN_ROWS", "10000"))
+PQ_N_LISTS: int = int(os.getenv("PQ_N_LISTS", "256"))
+PQ_N_SUBVECTORS: int = int(os.getenv("PQ_N_SUBVECTORS", "64"))
+PQ_N_PROBE: int = int(os.getenv("PQ_N_PROBE", "16"))
+PQ_RERANK_FACTOR: int = int(os.getenv("PQ_RERANK_FACTOR", "4"))
+PQ_TRAIN_SAMPLE: int = int(os.getenv("PQ_TRAIN_SAMPLE", "65536"))
+
+# ── Snapshots ─────────────────────────────────────────────────────────────────
+# Bundle imported once into BASE_COLLECTION_NAME (empty = no shared corpus)
+SNAPSHOT_DIR: str = os.getenv("SNAPSHOT_DIR", "")
+# Operator opt-in: lets sessions export to <dir>/<session_id> (empty = disabled)
+SNAPSHOT_EXPORT_DIR: str = os.getenv("SNAPSHOT_EXPORT_DIR", "")
+
+# ── Chat UI ───────────────────────────────────────────────────────────────────
+CHAT_PAGE_SIZE: int = int(os.getenv("CHAT_PAGE_SIZE", "10"))
+THUMBNAIL_SIZE: int = int(os.getenv("THUMBNAIL_SIZE", "256"))
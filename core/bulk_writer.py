@@ -0,0 +1,108 @@
+"""
+core/bulk_writer.py
+Buffers embedded documents and writes them to the vector store in batches,
+optionally on a background thread so embedding overlaps with persistence.
+"""
+
+from __future__ import annotations
+
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+from langchain_core.documents import Document
+
+from config import INGEST_BATCH_SIZE
+from core.vector_store import ChromaVectorStore
+
+
+class BulkWriter:
+    """Batching front-end for ``ChromaVectorStore.add_embeddings``.
+
+    Use as a context manager; leaving the block flushes the buffer and waits
+    for pending writes, re-raising any error from the writer thread.
+    """
+
+    def __init__(
+        self,
+        vector_store: ChromaVectorStore,
+        batch_size: int = INGEST_BATCH_SIZE,
+        upsert: bool = False,
+        background: bool = True,
+        max_pending: int = 2,
+    ) -> None:
+        self.vector_store = vector_store
+        self.batch_size = batch_size
+        self.upsert = upsert
+        self.max_pending = max_pending
+        self.written = 0
+
+        self._docs: list[Document] = []
+        self._embeddings: list[np.ndarray] = []
+        self._executor = ThreadPoolExecutor(max_workers=1) if background else None
+        self._pending: deque[Future] = deque()
+
+    # ── public API ────────────────────────────────────────────────────────────
+    def add(self, docs: list[Document], embeddings: list[np.ndarray] | np.ndarray) -> None:
+        """Buffer documents, writing out every full batch."""
+        if len(docs) != len(embeddings):
+            raise ValueError("docs and embeddings must have the same length.")
+        self._docs.extend(docs)
+        self._embeddings.extend(embeddings)
+        while len(self._docs) >= self.batch_size:
+            self._submit(self.batch_size)
+
+    def flush(self) -> None:
+        """Submit whatever is buffered, even if it is a partial batch."""
+        if self._docs:
+            self._submit(len(self._docs))
+
+    def drain(self) -> None:
+        """Flush and block until every pending write has been persisted."""
+        self.flush()
+        while self._pending:
+            self._pending.popleft().result()
+
+    def close(self) -> None:
+        """Flush, wait for every pending write and persist the store's index."""
+        self.drain()
+        self.vector_store.flush()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+
+    @property
+    def buffered(self) -> int:
+        return len(self._docs)
+
+    def __enter__(self) -> BulkWriter:
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+        elif self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+
+    # ── private helpers ───────────────────────────────────────────────────────
+    def _submit(self, n: int) -> None:
+        docs, self._docs = self._docs[:n], self._docs[n:]
+        embeddings = np.stack(self._embeddings[:n])
+        self._embeddings = self._embeddings[n:]
+
+        if self._executor is None:
+            self._write(docs, embeddings)
+            return
+
+        # Bound the queue so a slow store applies backpressure to embedding
+        while len(self._pending) >= self.max_pending:
+            self._pending.popleft().result()
+        self._pending.append(self._executor.submit(self._write, docs, embeddings))
+
+    def _write(self, docs: list[Document], embeddings: np.ndarray) -> None:
+        self.vector_store.add_embeddings(
+            documents=[doc.page_content for doc in docs],
+            metadatas=[doc.metadata for doc in docs],
+            embeddings=embeddings,
+            upsert=self.upsert,
+        )
+        self.written += len(docs)
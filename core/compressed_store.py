@@ -0,0 +1,489 @@
+"""
+core/compressed_store.py
+Vector store for corpora whose float32 vectors no longer fit in RAM.
+
+Each collection lives in its own directory::
+
+    records.sqlite   id, document and metadata per row (no vector index)
+    vectors.f32      exact float32 vectors, memory-mapped for reranking
+    codes.u8         IVF-PQ code of every row
+    lists.i32        inverted list of every row
+    codebooks.npz    trained coarse centroids and PQ codebooks
+
+Only the PQ codes and the int32 row numbers of the inverted lists stay in
+RAM; every file is appended to or patched in place, so a flush never
+rewrites the collection.
+"""
+
+from __future__ import annotations
+
+import json
+import shutil
+import sqlite3
+import threading
+import uuid
+from collections.abc import Iterator
+from pathlib import Path
+from typing import Any
+
+import chromadb
+import numpy as np
+from langchain_core.documents import Document
+
+from config import (
+    CHROMA_COLLECTION_NAME,
+    CHROMA_PERSIST_DIR,
+    PQ_MIN_TRAIN_ROWS,
+    PQ_N_LISTS,
+    PQ_N_PROBE,
+    PQ_N_SUBVECTORS,
+    PQ_RERANK_FACTOR,
+    PQ_TRAIN_SAMPLE,
+    VECTOR_INDEX,
+)
+from core.pq_index import IVFPQIndex, RowFile, exact_top_k, recall_at_k
+from core.vector_store import ChromaVectorStore, RetrievedDoc
+
+_SQL_OPS = {"$eq": "=", "$ne": "!=", "$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}
+# Stay below SQLite's bound-parameter limit
+_SQL_CHUNK = 900
+
+
+def _where_sql(where: dict[str, Any]) -> tuple[str, list[Any]]:
+    """Translate a Chroma ``where`` filter (see ``build_where``) into SQL."""
+    for logical, joiner in (("$and", " AND "), ("$or", " OR ")):
+        if logical in where:
+            parts = [_where_sql(clause) for clause in where[logical]]
+            return (
+                "(" + joiner.join(sql for sql, _ in parts) + ")",
+                [param for _, params in parts for param in params],
+            )
+    if len(where) != 1:
+        return _where_sql({"$and": [{key: value} for key, value in where.items()]})
+
+    (key, condition), = where.items()
+    if not isinstance(condition, dict):
+        condition = {"$eq": condition}
+    (op, value), = condition.items()
+    column = "json_extract(metadata, ?)"
+    path = f'$."{key}"'
+    if op in ("$in", "$nin"):
+        marks = ",".join("?" * len(value))
+        negate = "NOT " if op == "$nin" else ""
+        return f"{column} {negate}IN ({marks})", [path, *value]
+    if op not in _SQL_OPS:
+        raise ValueError(f"Unsupported where operator: {op!r}")
+    return f"{column} {_SQL_OPS[op]} ?", [path, value]
+
+
+class CompressedVectorStore:
+    """IVF-PQ store with the ``ChromaVectorStore`` interface.
+
+    Queries scan the PQ codes and rerank the best ``k * rerank_factor``
+    candidates on the exact vectors.  Until ``min_train_rows`` vectors are
+    stored there is no index and queries scan the exact vectors instead;
+    ``flush`` trains it once enough have arrived.
+    """
+
+    def __init__(
+        self,
+        persist_directory: str = CHROMA_PERSIST_DIR,
+        collection_name: str = CHROMA_COLLECTION_NAME,
+        embedding_dim: int = 512,
+        n_probe: int = PQ_N_PROBE,
+        rerank_factor: int = PQ_RERANK_FACTOR,
+        min_train_rows: int = PQ_MIN_TRAIN_ROWS,
+    ) -> None:
+        self.persist_directory = persist_directory
+        self.collection_name = collection_name
+        self.embedding_dim = embedding_dim
+        self.n_probe = n_probe
+        self.rerank_factor = rerank_factor
+        self.min_train_rows = min_train_rows
+
+        self.directory = self.directory_for(persist_directory, collection_name)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._vectors = RowFile(self.directory / "vectors.f32", embedding_dim)
+        self._codes = RowFile(self.directory / "codes.u8", PQ_N_SUBVECTORS, np.uint8)
+        self._lists = RowFile(self.directory / "lists.i32", 1, np.int32)
+        self._codebooks_path = self.directory / "codebooks.npz"
+
+        # The connection is shared by the writer, query and shard threads
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(self.directory / "records.sqlite", check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS records ("
+            "pos INTEGER PRIMARY KEY, id TEXT NOT NULL UNIQUE, document TEXT, metadata TEXT)"
+        )
+        self._index = self._load_index()
+
+    @staticmethod
+    def directory_for(persist_directory: str, collection_name: str) -> Path:
+        """Where a collection's records, vectors and codes are kept."""
+        return Path(persist_directory) / "pq" / collection_name
+
+    # ── write ─────────────────────────────────────────────────────────────────
+    def add_documents(
+        self,
+        docs: list[Document],
+        embeddings: list[np.ndarray] | np.ndarray,
+        upsert: bool = False,
+    ) -> list[str]:
+        """Insert documents with their precomputed embeddings."""
+        if len(docs) != len(embeddings):
+            raise ValueError("docs and embeddings must have the same length.")
+        if not docs:
+            return []
+
+        return self.add_embeddings(
+            documents=[doc.page_content for doc in docs],
+            metadatas=[doc.metadata for doc in docs],
+            embeddings=np.stack(embeddings) if isinstance(embeddings, list) else embeddings,
+            upsert=upsert,
+        )
+
+    def add_embeddings(
+        self,
+        documents: list[str],
+        metadatas: list[dict[str, Any]],
+        embeddings: np.ndarray,
+        ids: list[str] | None = None,
+        upsert: bool = False,
+    ) -> list[str]:
+        """Append new rows; known ids are overwritten in place with ``upsert``.
+
+        As with Chroma's ``add``, known ids are skipped without ``upsert``.
+        Returns the ids given (or generated).
+        """
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if embeddings.ndim != 2 or embeddings.shape[1] != self.embedding_dim:
+            raise ValueError(f"Expected embeddings of shape (n, {self.embedding_dim}).")
+        if not (len(documents) == len(metadatas) == len(embeddings)):
+            raise ValueError("documents, metadatas and embeddings must have the same length.")
+        ids = ids or [str(uuid.uuid4()) for _ in documents]
+        last_row = {doc_id: row for row, doc_id in enumerate(ids)}
+
+        with self._lock:
+            known = self._positions(list(last_row))
+            fresh = [doc_id for doc_id in last_row if doc_id not in known]
+            if fresh:
+                rows = [last_row[doc_id] for doc_id in fresh]
+                positions = self._vectors.append(embeddings[rows])
+                self._db.executemany(
+                    "INSERT INTO records (pos, id, document, metadata) VALUES (?, ?, ?, ?)",
+                    [
+                        (int(pos), doc_id, documents[row], json.dumps(metadatas[row]))
+                        for pos, doc_id, row in zip(positions, fresh, rows)
+                    ],
+                )
+                self._index_rows(positions, embeddings[rows], replace=False)
+            if upsert and known:
+                rows = [last_row[doc_id] for doc_id in known]
+                positions = np.array(list(known.values()), dtype=np.int32)
+                self._vectors.write(positions, embeddings[rows])
+                self._db.executemany(
+                    "UPDATE records SET document = ?, metadata = ? WHERE pos = ?",
+                    [
+                        (documents[row], json.dumps(metadatas[row]), int(pos))
+                        for pos, row in zip(positions, rows)
+                    ],
+                )
+                self._index_rows(positions, embeddings[rows], replace=True)
+            self._db.commit()
+        return ids
+
+    def flush(self) -> None:
+        """Train the index once ``min_train_rows`` vectors are stored.
+
+        Everything else is persisted as it is written.
+        """
+        with self._lock:
+            if self._index is None and len(self._vectors) >= self.min_train_rows:
+                self.build_compressed_index()
+
+    def max_batch_size(self) -> int:
+        """Writes are not split; this only bounds callers that ask."""
+        return 65536
+
+    def drop(self) -> None:
+        """Delete the collection's files permanently."""
+        with self._lock:
+            self._db.close()
+            self._index = None
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+    def clear(self) -> None:
+        """Remove every row (and the index, which is retrained on a later flush)."""
+        with self._lock:
+            self._db.execute("DELETE FROM records")
+            self._db.commit()
+            self._vectors.clear()
+            self.drop_compressed_index()
+
+    # ── compressed index ──────────────────────────────────────────────────────
+    def build_compressed_index(
+        self,
+        n_lists: int = PQ_N_LISTS,
+        n_subvectors: int = PQ_N_SUBVECTORS,
+        sample_size: int = PQ_TRAIN_SAMPLE,
+        seed: int = 0,
+        block_size: int = 65536,
+    ) -> IVFPQIndex:
+        """Train on a sample of the stored vectors, then encode all of them."""
+        with self._lock:
+            n = len(self._vectors)
+            rng = np.random.default_rng(seed)
+            sample = np.sort(rng.choice(n, size=min(sample_size, n), replace=False))
+            index = IVFPQIndex(
+                dim=self.embedding_dim,
+                n_lists=n_lists,
+                n_subvectors=n_subvectors,
+                seed=seed,
+            )
+            index.train(self._vectors.read(sample))
+
+            self._codes = RowFile(self.directory / "codes.u8", n_subvectors, np.uint8)
+            self._codes.clear()
+            self._lists.clear()
+            for start in range(0, n, block_size):
+                assign, codes = index.encode(self._vectors.matrix[start:start + block_size])
+                positions = self._codes.append(codes)
+                self._lists.append(assign)
+                index.add_encoded(positions, assign, codes)
+            index.save_codebooks(self._codebooks_path)
+            self._index = index
+            return index
+
+    def drop_compressed_index(self) -> None:
+        """Fall back to exact scans until the next ``flush`` retrains the index."""
+        with self._lock:
+            self._index = None
+            self._codebooks_path.unlink(missing_ok=True)
+            self._codes.clear()
+            self._lists.clear()
+
+    @property
+    def compressed_index(self) -> IVFPQIndex | None:
+        return self._index
+
+    def memory_bytes(self) -> int:
+        """RAM held by the index, including its bookkeeping (0 before training)."""
+        return self._index.memory_bytes() if self._index is not None else 0
+
+    def compressed_recall(self, query_embeddings: np.ndarray, k: int = 5) -> float:
+        """Measure recall@k of the compressed index against brute force."""
+        if self._index is None:
+            raise RuntimeError("No compressed index has been built.")
+        query_embeddings = np.atleast_2d(query_embeddings)
+        exact = exact_top_k(self._vectors.matrix, query_embeddings, k).tolist()
+        approx = [[pos for pos, _ in self._search(q, k)] for q in query_embeddings]
+        return recall_at_k(approx, exact, k)
+
+    # ── read ──────────────────────────────────────────────────────────────────
+    def similarity_search(
+        self,
+        query_embedding: np.ndarray,
+        k: int = 5,
+        where: dict[str, Any] | None = None,
+    ) -> list[RetrievedDoc]:
+        """Return the top-k most similar documents for a query embedding."""
+        return self.similarity_search_many(
+            np.asarray(query_embedding)[None, :], k=k, where=where
+        )[0]
+
+    def similarity_search_many(
+        self,
+        query_embeddings: np.ndarray,
+        k: int = 5,
+        where: dict[str, Any] | None = None,
+    ) -> list[list[RetrievedDoc]]:
+        """Top-k search for each row of a ``(Q, dim)`` query matrix."""
+        query_embeddings = np.ascontiguousarray(query_embeddings, dtype=np.float32)
+        with self._lock:
+            retrieved: list[list[RetrievedDoc]] = []
+            for query in query_embeddings:
+                ranked = self._search(query, k, where)
+                records = self._records_at([pos for pos, _ in ranked])
+                retrieved.append([
+                    RetrievedDoc(page_content=doc, metadata=meta, distance=dist, id=doc_id)
+                    for (doc_id, doc, meta), (_, dist) in zip(
+                        (records[pos] for pos, _ in ranked), ranked
+                    )
+                ])
+            return retrieved
+
+    def get_documents(self, ids: list[str]) -> list[RetrievedDoc]:
+        """Fetch documents by id, in the given order (missing ids are skipped)."""
+        by_id: dict[str, RetrievedDoc] = {}
+        with self._lock:
+            for start in range(0, len(ids), _SQL_CHUNK):
+                chunk = ids[start:start + _SQL_CHUNK]
+                for doc_id, doc, meta in self._db.execute(
+                    "SELECT id, document, metadata FROM records "
+                    f"WHERE id IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                ):
+                    by_id[doc_id] = RetrievedDoc(
+                        page_content=doc, metadata=json.loads(meta), id=doc_id
+                    )
+        return [by_id[doc_id] for doc_id in ids if doc_id in by_id]
+
+    def iter_embeddings(
+        self, batch_size: int = 4096
+    ) -> Iterator[tuple[list[str], np.ndarray]]:
+        """Yield ``(ids, embeddings)`` pages covering the whole collection."""
+        for ids, embs, _, _ in self.iter_records(batch_size):
+            yield ids, embs
+
+    def iter_records(
+        self, batch_size: int = 4096
+    ) -> Iterator[tuple[list[str], np.ndarray, list[str], list[dict[str, Any]]]]:
+        """Yield ``(ids, embeddings, documents, metadatas)`` pages in row order."""
+        after = -1
+        while True:
+            with self._lock:
+                page = self._db.execute(
+                    "SELECT pos, id, document, metadata FROM records "
+                    "WHERE pos > ? ORDER BY pos LIMIT ?",
+                    (after, batch_size),
+                ).fetchall()
+                if not page:
+                    return
+                embs = self._vectors.read([pos for pos, *_ in page])
+            after = page[-1][0]
+            yield (
+                [doc_id for _, doc_id, _, _ in page],
+                embs,
+                [doc for _, _, doc, _ in page],
+                [json.loads(meta) for _, _, _, meta in page],
+            )
+
+    def count(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+    # ── private helpers ───────────────────────────────────────────────────────
+    def _load_index(self) -> IVFPQIndex | None:
+        """Reattach the index from its codebooks and the per-row codes."""
+        if not self._codebooks_path.exists():
+            return None
+        index = IVFPQIndex.load_codebooks(self._codebooks_path)
+        self._codes = RowFile(self.directory / "codes.u8", index.n_subvectors, np.uint8)
+        n = len(self._vectors)
+        if len(self._codes) != n or len(self._lists) != n:
+            # An interrupted write: retrain on the next flush
+            self.drop_compressed_index()
+            return None
+        block_size = 65536
+        for start in range(0, n, block_size):
+            positions = np.arange(start, min(start + block_size, n), dtype=np.int32)
+            index.add_encoded(
+                positions,
+                np.asarray(self._lists.matrix[start:start + block_size, 0]),
+                np.asarray(self._codes.matrix[start:start + block_size]),
+            )
+        return index
+
+    def _index_rows(self, positions: np.ndarray, embeddings: np.ndarray, replace: bool) -> None:
+        """Encode rows into the index and its on-disk codes, if trained."""
+        if self._index is None:
+            return
+        assign, codes = self._index.encode(embeddings)
+        if replace:
+            self._index.remove(positions, self._lists.read(positions)[:, 0])
+            self._codes.write(positions, codes)
+            self._lists.write(positions, assign)
+        else:
+            self._codes.append(codes)
+            self._lists.append(assign)
+        self._index.add_encoded(positions, assign, codes)
+
+    def _positions(self, ids: list[str]) -> dict[str, int]:
+        found: dict[str, int] = {}
+        for start in range(0, len(ids), _SQL_CHUNK):
+            chunk = ids[start:start + _SQL_CHUNK]
+            found.update(self._db.execute(
+                f"SELECT id, pos FROM records WHERE id IN ({','.join('?' * len(chunk))})",
+                chunk,
+            ))
+        return found
+
+    def _filter(self, where: dict[str, Any], positions: np.ndarray | None) -> np.ndarray:
+        """Positions matching ``where``, optionally restricted to ``positions``."""
+        sql, params = _where_sql(where)
+        if positions is not None:
+            if not len(positions):
+                return positions
+            sql += f" AND pos IN ({','.join('?' * len(positions))})"
+            params += [int(pos) for pos in positions]
+        rows = self._db.execute(f"SELECT pos FROM records WHERE {sql}", params).fetchall()
+        return np.array([pos for pos, in rows], dtype=np.int64)
+
+    def _search(
+        self,
+        query_embedding: np.ndarray,
+        k: int,
+        where: dict[str, Any] | None = None,
+    ) -> list[tuple[int, float]]:
+        """``(row, cosine distance)`` pairs, reranked on the exact vectors.
+
+        A ``where`` filter is applied to the candidate set, so filtered
+        searches of a trained index may return fewer than k hits.  CLIP
+        vectors are unit length, so the dot product is the cosine similarity.
+        """
+        query = np.asarray(query_embedding, dtype=np.float32)
+        if self._index is not None:
+            candidates, _ = self._index.search(
+                query, k=k * self.rerank_factor, n_probe=self.n_probe
+            )
+            if where is not None:
+                candidates = self._filter(where, candidates)
+        elif where is not None:
+            candidates = self._filter(where, None)
+        else:
+            candidates = exact_top_k(self._vectors.matrix, query, k)[0]
+        if not len(candidates):
+            return []
+
+        # Sorted positions make the memmap reads sequential
+        candidates = np.sort(np.asarray(candidates, dtype=np.int64))
+        sims = self._vectors.read(candidates) @ query
+        order = np.argsort(-sims)[:k]
+        return [(int(candidates[i]), float(1.0 - sims[i])) for i in order]
+
+    def _records_at(self, positions: list[int]) -> dict[int, tuple[str, str, dict[str, Any]]]:
+        """``pos → (id, document, metadata)`` for the final hits only."""
+        if not positions:
+            return {}
+        rows = self._db.execute(
+            "SELECT pos, id, document, metadata FROM records "
+            f"WHERE pos IN ({','.join('?' * len(positions))})",
+            positions,
+        )
+        return {pos: (doc_id, doc, json.loads(meta)) for pos, doc_id, doc, meta in rows}
+
+
+def open_vector_store(
+    persist_directory: str = CHROMA_PERSIST_DIR,
+    collection_name: str = CHROMA_COLLECTION_NAME,
+    embedding_dim: int = 512,
+    client: chromadb.ClientAPI | None = None,
+    index: str = VECTOR_INDEX,
+    **store_kwargs: Any,
+) -> ChromaVectorStore | CompressedVectorStore:
+    """The store for ``index``: ``"hnsw"`` (Chroma) or ``"pq"`` (compressed).
+
+    ``client`` and ``store_kwargs`` (HNSW parameters) only apply to Chroma.
+    """
+    if index == "pq":
+        return CompressedVectorStore(persist_directory, collection_name, embedding_dim)
+    if index != "hnsw":
+        raise ValueError(f"Unknown index: {index!r}")
+    return ChromaVectorStore(
+        persist_directory=persist_directory,
+        collection_name=collection_name,
+        embedding_dim=embedding_dim,
+        client=client,
+        **store_kwargs,
+    )
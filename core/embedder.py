@@ -38,8 +38,50 @@ class CLIPEmbedder:
     # ── public API ────────────────────────────────────────────────────────────
     def embed_text(self, text: str) -> np.ndarray:
         """Return a normalised 1-D CLIP text embedding."""
+        return self.embed_texts([text])[0]
+
+    def embed_texts(self, texts: list[str], batch_size: int = 64) -> np.ndarray:
+        """Return normalised text embeddings as a ``(len(texts), dim)`` array.
+
+        Texts are embedded ``batch_size`` at a time, one forward pass each.
+        """
+        if not texts:
+            return np.empty((0, self.embedding_dimension()), dtype=np.float32)
+        return np.concatenate([
+            self._embed_text_batch(texts[start:start + batch_size])
+            for start in range(0, len(texts), batch_size)
+        ])
+
+    def embed_image(self, image: Image.Image | str) -> np.ndarray:
+        """Return a normalised 1-D CLIP image embedding.
+
+        Args:
+            image: A PIL Image or a path to an image file.
+        """
+        return self.embed_images([image])[0]
+
+    def embed_images(
+        self, images: list[Image.Image | str], batch_size: int = 32
+    ) -> np.ndarray:
+        """Return normalised image embeddings as a ``(len(images), dim)`` array.
+
+        Images are embedded ``batch_size`` at a time, one forward pass each.
+        """
+        if not images:
+            return np.empty((0, self.embedding_dimension()), dtype=np.float32)
+        return np.concatenate([
+            self._embed_image_batch(images[start:start + batch_size])
+            for start in range(0, len(images), batch_size)
+        ])
+
+    def embedding_dimension(self) -> int:
+        """Return the dimension of produced embeddings."""
+        return self.model.config.projection_dim
+
+    # ── private helpers ───────────────────────────────────────────────────────
+    def _embed_text_batch(self, texts: list[str]) -> np.ndarray:
         inputs = self.processor(
-            text=text,
+            text=texts,
             return_tensors="pt",
             padding=True,
             truncation=True,
@@ -53,17 +95,14 @@ class CLIPEmbedder:
             pooled = text_outputs.pooler_output
             features = self.model.text_projection(pooled)
             features = features / features.norm(dim=-1, keepdim=True)
-        return features.squeeze().cpu().numpy()
-
-    def embed_image(self, image: Image.Image | str) -> np.ndarray:
-        """Return a normalised 1-D CLIP image embedding.
+        return features.cpu().numpy()
 
-        Args:
-            image: A PIL Image or a path to an image file.
-        """
-        if isinstance(image, str):
-            image = Image.open(image).convert("RGB")
-        inputs = self.processor(images=image, return_tensors="pt")
+    def _embed_image_batch(self, images: list[Image.Image | str]) -> np.ndarray:
+        images = [
+            Image.open(image).convert("RGB") if isinstance(image, str) else image
+            for image in images
+        ]
+        inputs = self.processor(images=images, return_tensors="pt")
         with torch.no_grad():
             vision_outputs = self.model.vision_model(
                 pixel_values=inputs["pixel_values"]
@@ -71,8 +110,4 @@ class CLIPEmbedder:
             pooled = vision_outputs.pooler_output
             features = self.model.visual_projection(pooled)
             features = features / features.norm(dim=-1, keepdim=True)
-        return features.squeeze().cpu().numpy()
-
-    def embedding_dimension(self) -> int:
-        """Return the dimension of produced embeddings."""
-        return self.model.config.projection_dim
\ No newline at end of file
+        return features.cpu().numpy()
\ No newline at end of file
@@ -0,0 +1,214 @@
+"""
+core/embedding_pool.py
+A pool of CLIP worker processes that shards embedding batches across
+cores.  Workers write their vectors straight into a shared-memory array,
+so results are never pickled back to the parent.
+"""
+
+from __future__ import annotations
+
+import itertools
+import math
+import multiprocessing as mp
+import queue
+import threading
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+from PIL import Image
+from transformers import CLIPConfig
+
+from config import (
+    CLIP_MODEL_NAME,
+    EMBED_SHARD_SIZE,
+    EMBED_THREADS_PER_WORKER,
+    EMBED_WORKERS,
+)
+
+
+def _worker_main(
+    model_name: str,
+    n_threads: int,
+    tasks: mp.Queue,
+    done: mp.Queue,
+) -> None:
+    """Worker loop: embed a shard and write it into the caller's shared array."""
+    import torch
+
+    from core.embedder import CLIPEmbedder
+
+    torch.set_num_threads(n_threads)
+    embedder = CLIPEmbedder(model_name)
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+        job_id, shm_name, shape, start, kind, items, batch_size = task
+        try:
+            if kind == "text":
+                vectors = embedder.embed_texts(items, batch_size=batch_size)
+            else:
+                vectors = embedder.embed_images(items, batch_size=batch_size)
+            shm = SharedMemory(name=shm_name)
+            try:
+                out = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+                out[start:start + len(items)] = vectors
+                del out
+            finally:
+                shm.close()
+            done.put((job_id, start, None))
+        except Exception as exc:
+            done.put((job_id, start, repr(exc)))
+
+
+class EmbeddingPool:
+    """Drop-in replacement for ``CLIPEmbedder`` backed by worker processes.
+
+    Each worker loads its own model copy and runs with ``threads_per_worker``
+    intra-op threads.  Every call is split into one shard per worker (at most
+    one forward-pass batch each) that idle workers pick up from a shared
+    queue.  Calls from several threads run concurrently: results are tagged
+    with their job id and routed back by a collector thread.
+    """
+
+    def __init__(
+        self,
+        n_workers: int = EMBED_WORKERS,
+        threads_per_worker: int = EMBED_THREADS_PER_WORKER,
+        model_name: str = CLIP_MODEL_NAME,
+        shard_size: int = EMBED_SHARD_SIZE,
+    ) -> None:
+        if n_workers < 1:
+            raise ValueError("EmbeddingPool needs at least one worker.")
+        self.model_name = model_name
+        # Default forward-pass batch, and so the largest shard
+        self.shard_size = shard_size
+        self._dim: int | None = None
+        self._job_ids = itertools.count(1)
+        self._jobs: dict[int, queue.Queue] = {}
+        self._jobs_lock = threading.Lock()
+
+        ctx = mp.get_context("spawn")
+        self._tasks = ctx.Queue()
+        self._done = ctx.Queue()
+        self._workers = [
+            ctx.Process(
+                target=_worker_main,
+                args=(model_name, threads_per_worker, self._tasks, self._done),
+                daemon=True,
+            )
+            for _ in range(n_workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+        self._router = threading.Thread(target=self._route_results, daemon=True)
+        self._router.start()
+
+    # ── public API ────────────────────────────────────────────────────────────
+    def embed_text(self, text: str) -> np.ndarray:
+        """Return a normalised 1-D CLIP text embedding."""
+        return self.embed_texts([text])[0]
+
+    def embed_texts(self, texts: list[str], batch_size: int | None = None) -> np.ndarray:
+        """Return a ``(len(texts), dim)`` array, sharded across workers.
+
+        ``batch_size`` is the workers' forward-pass batch, as for ``CLIPEmbedder``.
+        """
+        return self._run("text", texts, batch_size)
+
+    def embed_image(self, image: Image.Image | str) -> np.ndarray:
+        """Return a normalised 1-D CLIP image embedding."""
+        return self.embed_images([image])[0]
+
+    def embed_images(
+        self, images: list[Image.Image | str], batch_size: int | None = None
+    ) -> np.ndarray:
+        """Return a ``(len(images), dim)`` array, sharded across workers."""
+        return self._run("image", images, batch_size)
+
+    def embedding_dimension(self) -> int:
+        """Return the dimension of produced embeddings (read from the config)."""
+        if self._dim is None:
+            self._dim = CLIPConfig.from_pretrained(self.model_name).projection_dim
+        return self._dim
+
+    def close(self) -> None:
+        """Stop all workers."""
+        for _ in self._workers:
+            self._tasks.put(None)
+        for worker in self._workers:
+            worker.join(timeout=10)
+            if worker.is_alive():
+                worker.terminate()
+        self._done.put(None)
+        self._router.join(timeout=10)
+
+    def __enter__(self) -> EmbeddingPool:
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    # ── private helpers ───────────────────────────────────────────────────────
+    def _run(self, kind: str, items: list, batch_size: int | None) -> np.ndarray:
+        dim = self.embedding_dimension()
+        if not items:
+            return np.empty((0, dim), dtype=np.float32)
+
+        batch_size = batch_size or self.shard_size
+        # Spread every call over all workers, one forward pass per shard at most
+        shard_size = min(math.ceil(len(items) / len(self._workers)), batch_size)
+        shape = (len(items), dim)
+        shm = SharedMemory(create=True, size=len(items) * dim * 4)
+        job_id = next(self._job_ids)
+        results: queue.Queue = queue.Queue()
+        with self._jobs_lock:
+            self._jobs[job_id] = results
+        try:
+            starts = range(0, len(items), shard_size)
+            for start in starts:
+                self._tasks.put(
+                    (job_id, shm.name, shape, start, kind,
+                     items[start:start + shard_size], batch_size)
+                )
+            errors = self._collect(results, len(starts))
+            if errors:
+                raise RuntimeError(f"Embedding worker failed: {errors[0]}")
+            out = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+            result = out.copy()
+            del out
+        finally:
+            with self._jobs_lock:
+                self._jobs.pop(job_id, None)
+            shm.close()
+            shm.unlink()
+        return result
+
+    def _route_results(self) -> None:
+        """Collector thread: hand each finished shard to the job waiting for it."""
+        while True:
+            reply = self._done.get()
+            if reply is None:
+                return
+            job_id, start, error = reply
+            with self._jobs_lock:
+                results = self._jobs.get(job_id)
+            if results is not None:  # otherwise a late reply from an aborted job
+                results.put((start, error))
+
+    def _collect(self, results: queue.Queue, n_shards: int) -> list[str]:
+        """Wait for every shard of a job, failing fast if a worker dies."""
+        errors: list[str] = []
+        remaining = n_shards
+        while remaining:
+            try:
+                _, error = results.get(timeout=1.0)
+            except queue.Empty:
+                if not all(worker.is_alive() for worker in self._workers):
+                    raise RuntimeError("An embedding worker process exited unexpectedly.")
+                continue
+            remaining -= 1
+            if error:
+                errors.append(error)
+        return errors
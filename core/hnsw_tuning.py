@@ -0,0 +1,177 @@
+"""
+core/hnsw_tuning.py
+Recall/latency harness for Chroma's HNSW parameters.
+
+Exact brute-force top-k over the indexed embeddings is the ground truth;
+each (construction_ef, search_ef, M) setting is built in a scratch
+directory and measured for recall@k, query latency, build time and size.
+
+Queries are never part of the indexed set (an indexed query finds itself,
+which inflates recall): they are either real query embeddings loaded from
+``--queries-file`` or stored rows held out of the build.
+
+Run:  python -m core.hnsw_tuning --k 10 --queries 200
+      python -m core.hnsw_tuning --queries-file query_embeddings.npy
+"""
+
+from __future__ import annotations
+
+import argparse
+import itertools
+import tempfile
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+import chromadb
+import numpy as np
+from chromadb.config import Settings
+
+from config import CHROMA_COLLECTION_NAME
+from core.pq_index import exact_top_k, recall_at_k
+from core.vector_store import ChromaVectorStore
+
+
+@dataclass
+class HNSWTrial:
+    """Measurements for one HNSW parameter setting."""
+
+    construction_ef: int
+    search_ef: int
+    m: int
+    recall: float
+    mean_latency_ms: float
+    p95_latency_ms: float
+    build_seconds: float
+    index_bytes: int
+
+
+def _dir_size(path: Path) -> int:
+    return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+
+
+def run_trial(
+    embeddings: np.ndarray,
+    queries: np.ndarray,
+    ground_truth: list[list[int]],
+    k: int,
+    construction_ef: int,
+    search_ef: int,
+    m: int,
+    batch_size: int = 4096,
+) -> HNSWTrial:
+    """Build one index in a scratch directory and measure it."""
+    with tempfile.TemporaryDirectory() as tmp:
+        client = chromadb.PersistentClient(
+            path=tmp, settings=Settings(anonymized_telemetry=False)
+        )
+        try:
+            store = ChromaVectorStore(
+                persist_directory=tmp,
+                collection_name="hnsw_trial",
+                embedding_dim=embeddings.shape[1],
+                client=client,
+                hnsw_construction_ef=construction_ef,
+                hnsw_search_ef=search_ef,
+                hnsw_m=m,
+            )
+
+            start = time.perf_counter()
+            for offset in range(0, len(embeddings), batch_size):
+                chunk = embeddings[offset:offset + batch_size]
+                store.add_embeddings(
+                    documents=[str(offset + i) for i in range(len(chunk))],
+                    metadatas=[{"row": offset + i} for i in range(len(chunk))],
+                    embeddings=chunk,
+                    ids=[str(offset + i) for i in range(len(chunk))],
+                )
+            store.similarity_search(queries[0], k=k)  # forces the index to be flushed
+            build_seconds = time.perf_counter() - start
+
+            latencies: list[float] = []
+            approx: list[list[int]] = []
+            for query in queries:
+                start = time.perf_counter()
+                hits = store.similarity_search(query, k=k)
+                latencies.append((time.perf_counter() - start) * 1000)
+                approx.append([int(hit.id) for hit in hits])
+
+            index_bytes = _dir_size(Path(tmp))
+        finally:
+            # Chroma caches each client's system per path; release this trial's
+            # so finished indexes do not accumulate in memory across the sweep
+            client.clear_system_cache()
+
+    return HNSWTrial(
+        construction_ef=construction_ef,
+        search_ef=search_ef,
+        m=m,
+        recall=recall_at_k(approx, ground_truth, k),
+        mean_latency_ms=float(np.mean(latencies)),
+        p95_latency_ms=float(np.percentile(latencies, 95)),
+        build_seconds=build_seconds,
+        index_bytes=index_bytes,
+    )
+
+
+def sweep(
+    embeddings: np.ndarray,
+    queries: np.ndarray,
+    k: int = 10,
+    construction_efs: tuple[int, ...] = (100, 200),
+    search_efs: tuple[int, ...] = (10, 50, 100),
+    ms: tuple[int, ...] = (16, 32),
+) -> list[HNSWTrial]:
+    """Measure every combination of the given HNSW parameters."""
+    ground_truth = exact_top_k(embeddings, queries, k).tolist()
+    return [
+        run_trial(embeddings, queries, ground_truth, k, cef, sef, m)
+        for cef, sef, m in itertools.product(construction_efs, search_efs, ms)
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200,
+                        help="stored embeddings held out of the build as queries")
+    parser.add_argument("--queries-file",
+                        help=".npy of real query embeddings (nothing is held out)")
+    parser.add_argument("--construction-ef", type=int, nargs="+", default=[100, 200])
+    parser.add_argument("--search-ef", type=int, nargs="+", default=[10, 50, 100])
+    parser.add_argument("--m", type=int, nargs="+", default=[16, 32])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--collection", default=CHROMA_COLLECTION_NAME)
+    args = parser.parse_args()
+
+    store = ChromaVectorStore(collection_name=args.collection)
+    chunks = [embs for _, embs in store.iter_embeddings()]
+    if not chunks:
+        raise SystemExit("The collection is empty — index some documents first.")
+    embeddings = np.concatenate(chunks)
+
+    if args.queries_file:
+        queries = np.load(args.queries_file).astype(np.float32)
+    else:
+        if len(embeddings) <= args.queries:
+            raise SystemExit("Not enough embeddings to hold out --queries rows.")
+        rng = np.random.default_rng(args.seed)
+        held_out = np.zeros(len(embeddings), dtype=bool)
+        held_out[rng.choice(len(embeddings), size=args.queries, replace=False)] = True
+        queries, embeddings = embeddings[held_out], embeddings[~held_out]
+
+    trials = sweep(
+        embeddings, queries, args.k, args.construction_ef, args.search_ef, args.m
+    )
+    header = list(asdict(trials[0]).keys())
+    print("\t".join(header))
+    for trial in sorted(trials, key=lambda t: (-t.recall, t.mean_latency_ms)):
+        row = asdict(trial)
+        print("\t".join(
+            f"{row[col]:.4f}" if isinstance(row[col], float) else str(row[col])
+            for col in header
+        ))
+
+
+if __name__ == "__main__":
+    main()
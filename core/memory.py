@@ -0,0 +1,212 @@
+"""
+core/memory.py
+Keeps ingestion within a resident-memory budget by shrinking batch sizes,
+forcing flushes, spilling image payloads to disk and pausing parsing while
+the process is over budget.
+"""
+
+from __future__ import annotations
+
+import gc
+import itertools
+import shutil
+import tempfile
+import time
+import weakref
+from collections.abc import Callable, Iterator, MutableMapping
+from dataclasses import dataclass
+from pathlib import Path
+
+import psutil
+
+from config import INGEST_RSS_BUDGET_MB
+
+
+def current_rss() -> int:
+    """Resident set size of this process in bytes."""
+    return psutil.Process().memory_info().rss
+
+
+@dataclass
+class IngestStats:
+    """Memory figures recorded for one ingest run."""
+
+    start_rss_bytes: int = 0
+    peak_rss_bytes: int = 0
+    throttled_seconds: float = 0.0
+    forced_flushes: int = 0
+    min_scale: float = 1.0
+    spilled: bool = False
+
+    @property
+    def peak_rss_mb(self) -> float:
+        return self.peak_rss_bytes / 2**20
+
+    def summary(self) -> str:
+        text = (
+            f"peak RSS {self.peak_rss_mb:.0f} MB "
+            f"(+{(self.peak_rss_bytes - self.start_rss_bytes) / 2**20:.0f} MB), "
+            f"throttled {self.throttled_seconds:.1f}s, "
+            f"{self.forced_flushes} forced flushes, min batch scale {self.min_scale:.2f}"
+        )
+        return text + ", images spilled to disk" if self.spilled else text
+
+
+class MemoryBudgetExceeded(RuntimeError):
+    """Raised when an ingest cannot get back under its memory budget."""
+
+
+class ImageStore(MutableMapping[str, str]):
+    """``image_id → base64`` payloads, kept in RAM until ``spill`` is called.
+
+    After a spill every payload (current and future) lives in a temporary
+    directory and only its path stays in memory; ``clear`` removes the files
+    and returns to in-memory storage.
+    """
+
+    def __init__(self) -> None:
+        self._memory: dict[str, str] = {}
+        self._spilled: dict[str, Path] = {}
+        self._directory: Path | None = None
+        self._file_numbers = itertools.count()
+        self._cleanup: weakref.finalize | None = None
+
+    @property
+    def spilled(self) -> bool:
+        return self._directory is not None
+
+    def spill(self) -> None:
+        """Move every payload to disk and write later ones there directly."""
+        if self._directory is None:
+            self._directory = Path(tempfile.mkdtemp(prefix="duosense_images_"))
+            self._cleanup = weakref.finalize(
+                self, shutil.rmtree, self._directory, ignore_errors=True
+            )
+        for image_id in list(self._memory):
+            self[image_id] = self._memory.pop(image_id)
+
+    def clear(self) -> None:
+        self._memory.clear()
+        self._spilled.clear()
+        if self._cleanup is not None:
+            self._cleanup()
+        self._directory = self._cleanup = None
+
+    def __getitem__(self, image_id: str) -> str:
+        if image_id in self._memory:
+            return self._memory[image_id]
+        return self._spilled[image_id].read_text()
+
+    def __setitem__(self, image_id: str, b64: str) -> None:
+        if self._directory is None:
+            self._memory[image_id] = b64
+            return
+        path = self._spilled.get(image_id) or self._directory / f"{next(self._file_numbers)}.b64"
+        path.write_text(b64)
+        self._spilled[image_id] = path
+
+    def __delitem__(self, image_id: str) -> None:
+        if image_id in self._memory:
+            del self._memory[image_id]
+        else:
+            self._spilled.pop(image_id).unlink(missing_ok=True)
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self._memory
+        yield from self._spilled
+
+    def __len__(self) -> int:
+        return len(self._memory) + len(self._spilled)
+
+    def __contains__(self, image_id: object) -> bool:
+        return image_id in self._memory or image_id in self._spilled
+
+
+class MemoryGovernor:
+    """Adapts ingestion to memory growth against ``budget_bytes``.
+
+    Pressure is measured as RSS growth since the governor was created, so
+    the CLIP model and other sessions' memory in the same process do not
+    count against an ingest.  ``update`` (called once per page or block)
+    halves the batch scale while growth is above ``soft_ratio * budget`` and
+    still climbing, and recovers it gradually below the soft limit.  Above the
+    hard budget ``wait_for_headroom`` flushes, runs the ``release`` callback
+    (e.g. ``ImageStore.spill``) and blocks parsing until memory is back under
+    budget, raising ``MemoryBudgetExceeded`` if it is not within ``max_wait``.
+    A budget of 0 disables throttling but still records peak memory.
+    """
+
+    def __init__(
+        self,
+        budget_bytes: int = INGEST_RSS_BUDGET_MB * 2**20,
+        soft_ratio: float = 0.8,
+        min_scale: float = 1 / 32,
+        poll_interval: float = 0.05,
+        max_wait: float = 5.0,
+    ) -> None:
+        self.budget_bytes = budget_bytes
+        self.soft_limit = int(budget_bytes * soft_ratio)
+        self.min_scale = min_scale
+        self.poll_interval = poll_interval
+        self.max_wait = max_wait
+        self.scale = 1.0
+        self._last_growth = 0
+
+        rss = current_rss()
+        self.stats = IngestStats(start_rss_bytes=rss, peak_rss_bytes=rss)
+
+    # ── public API ────────────────────────────────────────────────────────────
+    def sample(self) -> int:
+        """Measure RSS growth since start and record the peak RSS."""
+        rss = current_rss()
+        self.stats.peak_rss_bytes = max(self.stats.peak_rss_bytes, rss)
+        return rss - self.stats.start_rss_bytes
+
+    def update(self) -> bool:
+        """Adapt the batch scale once; True when callers should flush now."""
+        growth = self.sample()
+        if not self.budget_bytes:
+            return False
+        over_soft = growth > self.soft_limit
+        if over_soft and growth > self._last_growth:
+            self.scale = max(self.min_scale, self.scale / 2)
+        elif not over_soft:
+            self.scale = min(1.0, self.scale * 1.25)
+        self.stats.min_scale = min(self.stats.min_scale, self.scale)
+        self._last_growth = growth
+        if over_soft:
+            self.stats.forced_flushes += 1
+        return over_soft
+
+    def batch_size(self, nominal: int) -> int:
+        """Scale a nominal batch size to the current memory pressure."""
+        return max(1, int(nominal * self.scale))
+
+    def wait_for_headroom(
+        self,
+        flush: Callable[[], None] | None = None,
+        release: Callable[[], None] | None = None,
+    ) -> None:
+        """Backpressure: block until growth is under budget.
+
+        Raises ``MemoryBudgetExceeded`` when it is still over after ``max_wait``.
+        """
+        if not self.budget_bytes or self.sample() <= self.budget_bytes:
+            return
+        start = time.monotonic()
+        if flush is not None:
+            flush()
+        if release is not None:
+            release()
+        gc.collect()
+        try:
+            while (growth := self.sample()) > self.budget_bytes:
+                if time.monotonic() - start > self.max_wait:
+                    raise MemoryBudgetExceeded(
+                        f"Ingest memory grew by {growth / 2**20:.0f} MB, over the "
+                        f"{self.budget_bytes / 2**20:.0f} MB budget, and was not "
+                        "released; raise INGEST_RSS_BUDGET_MB or index a smaller file."
+                    )
+                time.sleep(self.poll_interval)
+        finally:
+            self.stats.throttled_seconds += time.monotonic() - start
@@ -7,99 +7,359 @@ and loads everything into the ChromaDB vector store.
 from __future__ import annotations
 
 import base64
+import codecs
+import hashlib
 import io
+import math
+import re
+from collections import defaultdict
+from dataclasses import dataclass
 from pathlib import Path
+from typing import BinaryIO
 
 import fitz  # PyMuPDF
 from langchain_core.documents import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from PIL import Image
 
-from config import CHUNK_OVERLAP, CHUNK_SIZE
+from config import (
+    BOILERPLATE_EDGE_LINES,
+    BOILERPLATE_MIN_PAGES,
+    BOILERPLATE_MIN_RATIO,
+    BOILERPLATE_MODE,
+    CHUNK_OVERLAP,
+    CHUNK_SIZE,
+    IMAGE_DECODE_MAX_SIDE,
+    IMAGE_MAX_ASPECT_RATIO,
+    IMAGE_MAX_SIDE,
+    IMAGE_MIN_BYTES,
+    IMAGE_MIN_SIDE,
+    INGEST_BATCH_SIZE,
+    INGEST_EMBED_BATCH_SIZE,
+    INGEST_READ_BLOCK_BYTES,
+    INGEST_RSS_BUDGET_MB,
+)
+from core.bulk_writer import BulkWriter
 from core.embedder import CLIPEmbedder
+from core.embedding_pool import EmbeddingPool
+from core.memory import ImageStore, IngestStats, MemoryGovernor
 from core.vector_store import ChromaVectorStore
 
 
+# "12", "Page 3", "page 3 of 40", "3 / 40" — the only lines whose digits are masked
+_PAGE_NUMBER_RE = re.compile(r"(page\s*)?\d+(\s*(of|/)\s*\d+)?")
+
+
+def _line_key(line: str) -> tuple[bytes, bool] | None:
+    """Hash a line after normalising case and whitespace.
+
+    Digits are masked only in page-number lines, so "Page 3 of 40" and
+    "Page 4 of 40" share a key while table cells and figures keep theirs.
+    Returns ``(key, is_page_number)``; blank lines give ``None``.
+    """
+    normalised = re.sub(r"\s+", " ", line.lower()).strip()
+    if not normalised:
+        return None
+    is_page_number = _PAGE_NUMBER_RE.fullmatch(normalised) is not None
+    if is_page_number:
+        normalised = re.sub(r"\d+", "#", normalised)
+    return hashlib.blake2b(normalised.encode(), digest_size=8).digest(), is_page_number
+
+
+def _edge_lines(lines: list[str], n: int) -> set[int]:
+    """Indices of the first and last ``n`` non-blank lines (header/footer zones)."""
+    non_blank = [i for i, line in enumerate(lines) if line.strip()]
+    return set(non_blank[:n]) | set(non_blank[-n:]) if n > 0 else set()
+
+
+@dataclass
+class ImageAdmissionPolicy:
+    """Decides from image metadata alone whether an image is worth decoding."""
+
+    min_side: int = IMAGE_MIN_SIDE
+    max_side: int = IMAGE_MAX_SIDE
+    min_bytes: int = IMAGE_MIN_BYTES
+    max_aspect_ratio: float = IMAGE_MAX_ASPECT_RATIO
+    # Admitted images are decoded no larger than this (CLIP uses 224px anyway)
+    decode_max_side: int = IMAGE_DECODE_MAX_SIDE
+
+    def admits_size(self, width: int, height: int) -> bool:
+        """Reject icons, spacers, hairlines and oversized scans."""
+        if min(width, height) < self.min_side or max(width, height) > self.max_side:
+            return False
+        return max(width, height) / max(min(width, height), 1) <= self.max_aspect_ratio
+
+    def admits_bytes(self, n_bytes: int) -> bool:
+        return n_bytes >= self.min_bytes
+
+
 class PDFProcessor:
     """Extracts text and images from a PDF and indexes them in ChromaDB."""
 
     def __init__(
         self,
-        embedder: CLIPEmbedder,
+        embedder: CLIPEmbedder | EmbeddingPool,
         vector_store: ChromaVectorStore,
         chunk_size: int = CHUNK_SIZE,
         chunk_overlap: int = CHUNK_OVERLAP,
+        image_policy: ImageAdmissionPolicy | None = None,
+        memory_budget_mb: int = INGEST_RSS_BUDGET_MB,
+        boilerplate_mode: str = BOILERPLATE_MODE,
     ) -> None:
         self.embedder = embedder
         self.vector_store = vector_store
+        self.image_policy = image_policy or ImageAdmissionPolicy()
         self.splitter = RecursiveCharacterTextSplitter(
             chunk_size=chunk_size,
             chunk_overlap=chunk_overlap,
         )
-        # In-memory store mapping image_id → base64 string (for LLM vision)
-        self.image_data_store: dict[str, str] = {}
+        # image_id → base64 string (for LLM vision); spilled to disk over budget
+        self.image_data_store = ImageStore()
+
+        if boilerplate_mode not in ("strip", "collapse", "off"):
+            raise ValueError(f"Unknown boilerplate_mode: {boilerplate_mode!r}")
+        self.boilerplate_mode = boilerplate_mode
+        self._boilerplate: set[bytes] = set()
+        # Per page: edge-zone line index → key, from the boilerplate pre-pass
+        self._page_edge_keys: list[dict[int, bytes]] = []
+
+        self.memory_budget_bytes = memory_budget_mb * 2**20
+        self._governor = MemoryGovernor(budget_bytes=0)
+        # Peak memory etc. of the most recent ingest
+        self.last_ingest_stats: IngestStats | None = None
 
     # ── public API ────────────────────────────────────────────────────────────
-    def process(self, pdf_path: str | Path) -> None:
+    def process(self, pdf_path: str | Path, doc_id: str | None = None) -> None:
         """Full pipeline: parse → embed → store.
 
         Clears the vector store before indexing so re-uploads start fresh.
+        Every chunk is tagged with ``doc_id`` (defaults to the file name) so
+        retrieval can filter on it.
         """
         self.image_data_store.clear()
         self.vector_store.clear()
 
-        all_docs: list[Document] = []
-        all_embeddings = []
-
         pdf_path = Path(pdf_path)
+        doc_id = doc_id or pdf_path.name
         doc = fitz.open(str(pdf_path))
 
+        self._governor = MemoryGovernor(budget_bytes=self.memory_budget_bytes)
+
+        # Pages are written in batches while the next ones are being embedded
         try:
-            for page_idx, page in enumerate(doc):
-                text_docs, text_embs = self._process_text(page, page_idx)
-                all_docs.extend(text_docs)
-                all_embeddings.extend(text_embs)
-
-                img_docs, img_embs = self._process_images(doc, page, page_idx)
-                all_docs.extend(img_docs)
-                all_embeddings.extend(img_embs)
+            boilerplate = self._find_boilerplate(doc)
+            self._boilerplate = set(boilerplate) if self.boilerplate_mode != "off" else set()
+            with BulkWriter(self.vector_store) as writer:
+                if self.boilerplate_mode == "collapse":
+                    writer.add(*self._collapsed_boilerplate(boilerplate, doc_id))
+                # Text chunks are embedded in batches spanning pages, so each
+                # call is large enough to keep every embedding worker busy
+                pending: list[Document] = []
+                for page_idx, page in enumerate(doc):
+                    # Backpressure: stop parsing new pages while over budget
+                    self._governor.wait_for_headroom(
+                        flush=writer.drain, release=self.image_data_store.spill
+                    )
+
+                    pending.extend(self._process_text(page, page_idx, doc_id))
+                    if len(pending) >= self._governor.batch_size(INGEST_EMBED_BATCH_SIZE):
+                        self._write_texts(pending, writer)
+                        pending = []
+
+                    img_docs, img_embs = self._process_images(doc, page, page_idx, doc_id)
+                    writer.add(img_docs, img_embs)
+                    self._throttle(writer)
+                self._write_texts(pending, writer)
         finally:
             doc.close()
+            self._page_edge_keys = []
+            self._record_stats(doc_id)
+
+    def process_text_file(self, file: BinaryIO, doc_id: str) -> None:
+        """Index a UTF-8 text file, reading it in fixed-size blocks.
 
-        if all_docs:
-            self.vector_store.add_documents(all_docs, all_embeddings)
+        Only one block plus the trailing partial chunk is held at a time, so
+        large uploads are never decoded into a single string.
+        """
+        self.image_data_store.clear()
+        self.vector_store.clear()
+        self._governor = MemoryGovernor(budget_bytes=self.memory_budget_bytes)
+
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+        metadata = {"page": 0, "type": "text", "doc_id": doc_id}
+        carry = ""
+        try:
+            with BulkWriter(self.vector_store) as writer:
+                while True:
+                    self._governor.wait_for_headroom(flush=writer.drain)
+                    block = file.read(INGEST_READ_BLOCK_BYTES)
+                    text = carry + decoder.decode(block, final=not block)
+                    pieces = self.splitter.split_text(text) if text.strip() else []
+                    # The last piece may continue in the next block; carry the raw
+                    # text from its start, since split_text strips whitespace
+                    carry = ""
+                    if block and pieces:
+                        carry = text[self._last_piece_offset(text, pieces):]
+                        pieces.pop()
+
+                    if pieces:
+                        chunks = [Document(page_content=p, metadata=dict(metadata)) for p in pieces]
+                        writer.add(chunks, self._embed_texts(pieces))
+                        self._throttle(writer)
+                    if not block:
+                        break
+        finally:
+            self._record_stats(doc_id)
 
     # ── private helpers ───────────────────────────────────────────────────────
-    def _process_text(
-        self, page: fitz.Page, page_idx: int
+    @staticmethod
+    def _last_piece_offset(text: str, pieces: list[str]) -> int:
+        """Start of the last split piece within ``text``.
+
+        Pieces appear in order, so each is searched from the previous one's
+        start; with repetitive text this can only err towards an earlier
+        offset, i.e. carrying a little extra text rather than losing any.
+        """
+        offset = 0
+        for piece in pieces:
+            found = text.find(piece, offset)
+            if found < 0:
+                break
+            offset = found
+        return offset
+
+    def _record_stats(self, doc_id: str) -> None:
+        stats = self._governor.stats
+        stats.spilled = self.image_data_store.spilled
+        self.last_ingest_stats = stats
+        print(f"Ingested {doc_id}: {stats.summary()}")
+
+    def _throttle(self, writer: BulkWriter) -> None:
+        """Resize batches to current memory pressure; flush when it is high."""
+        if self._governor.update():
+            writer.drain()
+        writer.batch_size = self._governor.batch_size(INGEST_BATCH_SIZE)
+
+    def _embed_texts(self, texts: list[str]) -> list:
+        batch_size = self._governor.batch_size(INGEST_EMBED_BATCH_SIZE)
+        return list(self.embedder.embed_texts(texts, batch_size=batch_size))
+
+    def _find_boilerplate(
+        self, doc: fitz.Document
+    ) -> dict[bytes, tuple[str | None, list[int]]]:
+        """Map each header/footer line repeated on enough pages to ``(text, pages)``.
+
+        Only lines in each page's edge zones are considered.  The text is the
+        first occurrence, or ``None`` for page numbers, which differ per page.
+        Each page's edge-line keys are kept so ``_process_text`` can strip them
+        without hashing the lines again.
+        """
+        self._page_edge_keys = []
+        if self.boilerplate_mode == "off":
+            return {}
+        pages: defaultdict[bytes, list[int]] = defaultdict(list)
+        texts: dict[bytes, str | None] = {}
+        for page_idx, page in enumerate(doc):
+            lines = page.get_text().splitlines()
+            edge_keys: dict[int, bytes] = {}
+            for i in sorted(_edge_lines(lines, BOILERPLATE_EDGE_LINES)):
+                key, is_page_number = _line_key(lines[i])
+                edge_keys[i] = key
+                if pages[key] and pages[key][-1] == page_idx:
+                    continue
+                pages[key].append(page_idx)
+                texts.setdefault(key, None if is_page_number else lines[i].strip())
+            self._page_edge_keys.append(edge_keys)
+
+        threshold = max(BOILERPLATE_MIN_PAGES, math.ceil(BOILERPLATE_MIN_RATIO * len(doc)))
+        return {
+            key: (texts[key], page_list)
+            for key, page_list in pages.items()
+            if len(page_list) >= threshold
+        }
+
+    def _collapsed_boilerplate(
+        self, boilerplate: dict[bytes, tuple[str | None, list[int]]], doc_id: str
     ) -> tuple[list[Document], list]:
-        """Split and embed all text on a single page."""
+        """One chunk per group of boilerplate lines sharing the same pages.
+
+        Page numbers are stripped but not collapsed: no single text is true
+        for every page they appear on.
+        """
+        groups: defaultdict[tuple[int, ...], list[str]] = defaultdict(list)
+        for text, page_list in boilerplate.values():
+            if text is not None:
+                groups[tuple(page_list)].append(text)
+
+        docs = [
+            Document(
+                page_content="\n".join(lines),
+                metadata={
+                    "page": page_list[0],
+                    "pages": ",".join(map(str, page_list)),
+                    "type": "text",
+                    "doc_id": doc_id,
+                    "boilerplate": True,
+                },
+            )
+            for page_list, lines in groups.items()
+        ]
+        return docs, self._embed_texts([d.page_content for d in docs]) if docs else []
+
+    def _write_texts(self, chunks: list[Document], writer: BulkWriter) -> None:
+        if chunks:
+            writer.add(chunks, self._embed_texts([chunk.page_content for chunk in chunks]))
+
+    def _process_text(self, page: fitz.Page, page_idx: int, doc_id: str) -> list[Document]:
+        """Split all text on a single page, minus header/footer boilerplate."""
         text = page.get_text()
+        if self._boilerplate:
+            drop = {
+                i for i, key in self._page_edge_keys[page_idx].items()
+                if key in self._boilerplate
+            }
+            if drop:
+                text = "\n".join(
+                    line for i, line in enumerate(text.splitlines()) if i not in drop
+                )
         if not text.strip():
-            return [], []
+            return []
 
         temp_doc = Document(
             page_content=text,
-            metadata={"page": page_idx, "type": "text"},
+            metadata={"page": page_idx, "type": "text", "doc_id": doc_id},
         )
-        chunks = self.splitter.split_documents([temp_doc])
-        embeddings = [self.embedder.embed_text(chunk.page_content) for chunk in chunks]
-        return chunks, embeddings
+        return self.splitter.split_documents([temp_doc])
 
     def _process_images(
-        self, doc: fitz.Document, page: fitz.Page, page_idx: int
+        self, doc: fitz.Document, page: fitz.Page, page_idx: int, doc_id: str
     ) -> tuple[list[Document], list]:
         """Extract, embed, and store all images on a single page."""
         img_docs: list[Document] = []
-        img_embeddings = []
+        pil_images: list[Image.Image] = []
 
         for img_idx, img in enumerate(page.get_images(full=True)):
             try:
-                xref = img[0]
-                base_image = doc.extract_image(xref)
-                image_bytes = base_image["image"]
+                # get_images rows: (xref, smask, width, height, ..., filter, ...)
+                xref, width, height, image_filter = img[0], img[2], img[3], img[8]
+                if not self.image_policy.admits_size(width, height):
+                    print(
+                        f"Warning: skipped image {img_idx} on page {page_idx}: "
+                        f"{width}x{height} px is outside the admitted size"
+                    )
+                    continue
+                raw = doc.xref_stream_raw(xref)  # still compressed
+                if not self.image_policy.admits_bytes(len(raw)):
+                    print(
+                        f"Warning: skipped image {img_idx} on page {page_idx}: "
+                        f"{len(raw)} bytes is below IMAGE_MIN_BYTES"
+                    )
+                    continue
 
-                pil_image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+                if image_filter == "DCTDecode":
+                    pil_image = self._decode_jpeg(raw)
+                else:
+                    pil_image = self._decode_image(doc, page, xref, width, height)
                 image_id = f"page_{page_idx}_img_{img_idx}"
 
                 # Store base64 for GPT-4V vision calls
@@ -109,16 +369,67 @@ class PDFProcessor:
                     buffered.getvalue()
                 ).decode()
 
-                embedding = self.embedder.embed_image(pil_image)
-                img_embeddings.append(embedding)
-
+                pil_images.append(pil_image)
                 img_doc = Document(
                     page_content=f"[Image: {image_id}]",
-                    metadata={"page": page_idx, "type": "image", "image_id": image_id},
+                    metadata={
+                        "page": page_idx,
+                        "type": "image",
+                        "image_id": image_id,
+                        "doc_id": doc_id,
+                    },
                 )
                 img_docs.append(img_doc)
 
             except Exception as exc:
-                print(f"Warning: could not process image {img_idx} on page {page_idx}: {exc}")
+                print(f"Warning: skipped image {img_idx} on page {page_idx}: {exc}")
+
+        # One batched call for the whole page
+        batch_size = self._governor.batch_size(INGEST_EMBED_BATCH_SIZE)
+        img_embeddings = (
+            list(self.embedder.embed_images(pil_images, batch_size=batch_size))
+            if pil_images else []
+        )
+        return img_docs, img_embeddings
+
+    def _decode_jpeg(self, image_bytes: bytes) -> Image.Image:
+        """Decode a JPEG to RGB no larger than the policy's ``decode_max_side``.
+
+        Draft mode downscales during decoding, so large scans never
+        materialise at full resolution.
+        """
+        max_side = self.image_policy.decode_max_side
+        pil_image = Image.open(io.BytesIO(image_bytes))
+        if max(pil_image.size) > max_side:
+            pil_image.draft("RGB", (max_side, max_side))
+            pil_image.thumbnail((max_side, max_side))
+        return pil_image.convert("RGB")
+
+    def _decode_image(
+        self, doc: fitz.Document, page: fitz.Page, xref: int, width: int, height: int
+    ) -> Image.Image:
+        """Decode any other image to RGB no larger than ``decode_max_side``.
+
+        Large images are rendered from their placement on the page at the
+        target scale, letting MuPDF subsample while decoding; small or
+        unplaced ones are decoded directly and halved until they fit.
+        """
+        max_side = self.image_policy.decode_max_side
+        rects = page.get_image_rects(xref) if max(width, height) > max_side else []
+        if rects:
+            rect = rects[0]
+            scale = max_side / max(rect.width, rect.height, 1e-6)
+            pix = page.get_pixmap(matrix=fitz.Matrix(scale, scale), clip=rect)
+        else:
+            pix = fitz.Pixmap(doc, xref)
+            longest = max(pix.width, pix.height)
+            if longest > 2 * max_side:
+                pix.shrink(int(math.log2(longest / max_side)))
+            if pix.alpha:
+                pix = fitz.Pixmap(pix, 0)
+            if pix.colorspace is None or pix.colorspace.n != 3:
+                pix = fitz.Pixmap(fitz.csRGB, pix)
 
-        return img_docs, img_embeddings
\ No newline at end of file
+        pil_image = Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+        pil_image.thumbnail((max_side, max_side))
+        return pil_image
\ No newline at end of file
@@ -5,14 +5,62 @@ Handles retrieval from ChromaDB and answer generation via the LLM.
 
 from __future__ import annotations
 
+import asyncio
 import os
+import re
+import threading
+import time
+from collections import Counter
+from collections.abc import Awaitable, Mapping
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, TypeVar
 
+import numpy as np
 from langchain.chat_models import init_chat_model
 from langchain_core.messages import HumanMessage
 
 import config
 from core.embedder import CLIPEmbedder
-from core.vector_store import ChromaVectorStore, RetrievedDoc
+from core.vector_store import ChromaVectorStore, RetrievedDoc, build_where
+
+
+# Degradation levels applied by ``answer`` under a deadline, mildest first
+DEGRADATION_NONE = "none"
+DEGRADATION_TRIMMED_IMAGES = "trimmed_images"
+DEGRADATION_REDUCED_TOP_K = "reduced_top_k"
+DEGRADATION_EXCERPTS_ONLY = "excerpts_only"
+
+# How often each degradation level was applied, across every retriever in
+# the process (retrievers are recreated on each re-index)
+DEGRADATION_COUNTS: Counter[str] = Counter()
+_degradation_lock = threading.Lock()
+
+T = TypeVar("T")
+
+
+def _record_degradation(level: str) -> None:
+    with _degradation_lock:
+        DEGRADATION_COUNTS[level] += 1
+        totals = dict(DEGRADATION_COUNTS)
+    if level != DEGRADATION_NONE:
+        print(f"Warning: answer degraded to {level!r} to meet its deadline; totals: {totals}")
+
+
+def reciprocal_rank_fusion(
+    result_lists: list[list[RetrievedDoc]],
+    k: int,
+    c: int = 60,
+) -> list[RetrievedDoc]:
+    """Fuse several ranked lists by summing ``1 / (c + rank)`` per document."""
+    scores: dict[str, float] = {}
+    best: dict[str, RetrievedDoc] = {}
+    for results in result_lists:
+        for rank, doc in enumerate(results):
+            scores[doc.id] = scores.get(doc.id, 0.0) + 1.0 / (c + rank + 1)
+            if doc.id not in best or doc.distance < best[doc.id].distance:
+                best[doc.id] = doc
+    ranked = sorted(scores, key=scores.get, reverse=True)[:k]
+    return [best[doc_id] for doc_id in ranked]
 
 
 class MultimodalRetriever:
@@ -22,13 +70,18 @@ class MultimodalRetriever:
         self,
         embedder: CLIPEmbedder,
         vector_store: ChromaVectorStore,
-        image_data_store: dict[str, str],
+        image_data_store: Mapping[str, str],
         top_k: int = config.TOP_K,
+        quotas: dict[str, int] | None = None,
+        query_expansions: int = config.QUERY_EXPANSIONS,
     ) -> None:
         self.embedder = embedder
         self.vector_store = vector_store
         self.image_data_store = image_data_store
         self.top_k = top_k
+        # e.g. {"text": 4, "image": 2}; overrides top_k when set
+        self.quotas = config.MODALITY_QUOTAS if quotas is None else quotas
+        self.query_expansions = query_expansions
 
         # configure OpenAI-compatible endpoint
         os.environ["OPENAI_API_KEY"] = config.OPENAI_API_KEY
@@ -36,28 +89,213 @@ class MultimodalRetriever:
 
         self.llm = init_chat_model(
             model=config.LLM_MODEL,
-            max_tokens=100,
+            max_tokens=config.LLM_MAX_TOKENS,
+            timeout=config.LLM_TIMEOUT_SECONDS,
         )
+        # Deadline-bound LLM calls run async so they can be cancelled; one loop
+        # is reused because the async HTTP client's pool is tied to it
+        self._loop = asyncio.new_event_loop()
 
     # ── public API ────────────────────────────────────────────────────────────
-    def retrieve(self, query: str, k: int | None = None) -> list[RetrievedDoc]:
-        """Embed the query and return the top-k most relevant documents."""
-        k = k or self.top_k
-        query_embedding = self.embedder.embed_text(query)
-        return self.vector_store.similarity_search(query_embedding, k=k)
+    def retrieve(
+        self,
+        query: str,
+        k: int | None = None,
+        where: dict[str, Any] | None = None,
+        quotas: dict[str, int] | None = None,
+        expansions: list[str] | None = None,
+    ) -> list[RetrievedDoc]:
+        """Embed the query and return the top-k most relevant documents.
+
+        Args:
+            where: Metadata filter pushed down to the vector store.
+            quotas: Results per modality (``{"text": 4, "image": 2}``), each
+                served by its own filtered query.  Defaults to ``self.quotas``;
+                pass ``{}`` to force a single top-k query.  An explicit ``k``
+                also bypasses quotas.
+            expansions: Extra phrasings of the query.  All phrasings are
+                embedded in one batch, searched in one call and fused by rank.
+                Defaults to ``expand_query(query)``.
+        """
+        quotas = self.quotas if quotas is None else quotas
+        if expansions is None:
+            expansions = self.expand_query(query)
+        query_embeddings = self.embedder.embed_texts([query, *expansions])
+        if quotas and k is None:
+            return self._retrieve_with_quotas(query_embeddings, quotas, where)
+
+        return self._search(query_embeddings, k or self.top_k, where)
+
+    def expand_query(self, query: str) -> list[str]:
+        """Ask the LLM for up to ``query_expansions`` paraphrases or sub-questions."""
+        if self.query_expansions <= 0:
+            return []
+        response = self.llm.invoke([self._expansion_message(query)])
+        return self._parse_expansions(query, str(response.content))
 
-    def answer(self, query: str) -> tuple[str, list[RetrievedDoc]]:
+    async def aexpand_query(self, query: str) -> list[str]:
+        """Async ``expand_query``; cancelling it aborts the LLM request."""
+        if self.query_expansions <= 0:
+            return []
+        response = await self.llm.ainvoke([self._expansion_message(query)])
+        return self._parse_expansions(query, str(response.content))
+
+    def answer(
+        self,
+        query: str,
+        deadline: float | None = config.ANSWER_DEADLINE_SECONDS,
+    ) -> tuple[str, list[RetrievedDoc], str]:
         """Full RAG pipeline: retrieve → build message → generate answer.
 
+        With a ``deadline`` (seconds), query expansion and retrieval get
+        ``ANSWER_RETRIEVAL_SHARE`` of the budget and generation the rest.  If
+        the estimated generation time no longer fits, context images are
+        dropped first, then text chunks, and finally the retrieved excerpts
+        are returned without calling the LLM.
+
         Returns:
-            (answer_text, retrieved_docs)
+            (answer_text, retrieved_docs, degradation) where ``degradation``
+            is one of the ``DEGRADATION_*`` levels.
         """
-        docs = self.retrieve(query)
-        message = self._build_message(query, docs)
-        response = self.llm.invoke([message])
-        return response.content, docs
+        if not deadline:
+            docs = self.retrieve(query)
+            response = self.llm.invoke([self._build_message(query, docs)])
+            _record_degradation(DEGRADATION_NONE)
+            return response.content, docs, DEGRADATION_NONE
+
+        start = time.monotonic()
+
+        def remaining() -> float:
+            return deadline - (time.monotonic() - start)
+
+        # Stage 1: expansion (an LLM round trip) only within the retrieval share
+        expansions: list[str] = []
+        if self.query_expansions > 0:
+            try:
+                expansions = self._run_within(
+                    self.aexpand_query(query), deadline * config.ANSWER_RETRIEVAL_SHARE
+                )
+            except asyncio.TimeoutError:
+                pass
+        docs = self.retrieve(query, expansions=expansions)
+
+        # Stage 2: shrink the context until the estimated generation time fits
+        # (skipped when retrieval has already used up the deadline)
+        if remaining() > 0:
+            context, degradation = self._fit_context(docs, remaining())
+            if degradation != DEGRADATION_EXCERPTS_ONLY:
+                try:
+                    response = self._run_within(
+                        self.llm.ainvoke([self._build_message(query, context)]), remaining()
+                    )
+                    _record_degradation(degradation)
+                    return response.content, context, degradation
+                except asyncio.TimeoutError:
+                    pass
+
+        # Stage 3: no time left to generate; hand back the evidence itself
+        _record_degradation(DEGRADATION_EXCERPTS_ONLY)
+        return self._excerpts_answer(docs), docs, DEGRADATION_EXCERPTS_ONLY
+
+    def close(self) -> None:
+        """Close the event loop used for deadline-bound LLM calls."""
+        self._loop.close()
 
     # ── private helpers ───────────────────────────────────────────────────────
+    def _run_within(self, call: Awaitable[T], timeout: float) -> T:
+        """Await ``call``, cancelling it (and its HTTP request) after ``timeout`` s."""
+        return self._loop.run_until_complete(asyncio.wait_for(call, max(timeout, 0.0)))
+
+    def _expansion_message(self, query: str) -> HumanMessage:
+        return HumanMessage(content=(
+            f"Rewrite the question below as {self.query_expansions} alternative "
+            "search queries (paraphrases or sub-questions), one per line, "
+            f"with no numbering or commentary.\n\nQuestion: {query}"
+        ))
+
+    def _parse_expansions(self, query: str, text: str) -> list[str]:
+        lines = (
+            re.sub(r"^\s*(?:[-*•]|\d+[.)])\s*", "", line).strip()
+            for line in text.splitlines()
+        )
+        expansions = [line for line in dict.fromkeys(lines) if line and line != query]
+        return expansions[: self.query_expansions]
+
+    @staticmethod
+    def _generation_estimate(docs: list[RetrievedDoc]) -> float:
+        n_images = sum(1 for d in docs if d.metadata.get("type") == "image")
+        return (
+            config.ANSWER_BASE_SECONDS
+            + config.ANSWER_SECONDS_PER_IMAGE * n_images
+            + config.ANSWER_SECONDS_PER_CHUNK * (len(docs) - n_images)
+        )
+
+    def _fit_context(
+        self, docs: list[RetrievedDoc], budget: float
+    ) -> tuple[list[RetrievedDoc], str]:
+        """Apply the mildest degradation whose estimated cost fits ``budget``."""
+        if self._generation_estimate(docs) <= budget:
+            return docs, DEGRADATION_NONE
+
+        text_docs = [d for d in docs if d.metadata.get("type") != "image"]
+        if text_docs and self._generation_estimate(text_docs) <= budget:
+            return text_docs, DEGRADATION_TRIMMED_IMAGES
+
+        # docs arrive best-first, so keep the head of the list
+        while len(text_docs) > 1 and self._generation_estimate(text_docs) > budget:
+            text_docs = text_docs[:-1]
+        if text_docs and self._generation_estimate(text_docs) <= budget:
+            return text_docs, DEGRADATION_REDUCED_TOP_K
+
+        return [], DEGRADATION_EXCERPTS_ONLY
+
+    @staticmethod
+    def _excerpts_answer(docs: list[RetrievedDoc], max_chars: int = 300) -> str:
+        """Fallback answer built from the retrieved chunks without generation."""
+        lines = ["The answer could not be generated in time. Most relevant excerpts:"]
+        for d in docs:
+            page = d.metadata.get("page", "?")
+            if d.metadata.get("type") == "image":
+                lines.append(f"- [Image from page {page}]")
+            else:
+                excerpt = d.page_content[:max_chars]
+                if len(d.page_content) > max_chars:
+                    excerpt += "…"
+                lines.append(f"- [Page {page}]: {excerpt}")
+        return "\n".join(lines)
+
+    def _search(
+        self,
+        query_embeddings: np.ndarray,
+        k: int,
+        where: dict[str, Any] | None,
+    ) -> list[RetrievedDoc]:
+        """One vector-store round trip for all query rows, fused by rank."""
+        results = self.vector_store.similarity_search_many(query_embeddings, k=k, where=where)
+        if len(results) == 1:
+            return results[0]
+        return reciprocal_rank_fusion(results, k)
+
+    def _retrieve_with_quotas(
+        self,
+        query_embeddings: np.ndarray,
+        quotas: dict[str, int],
+        where: dict[str, Any] | None,
+    ) -> list[RetrievedDoc]:
+        """Run one filtered query per modality in parallel and merge by distance."""
+        active = {doc_type: n for doc_type, n in quotas.items() if n > 0}
+        if not active:
+            return []
+
+        def search(doc_type: str, n: int) -> list[RetrievedDoc]:
+            modality = build_where(type=doc_type)
+            combined = {"$and": [where, modality]} if where else modality
+            return self._search(query_embeddings, n, combined)
+
+        with ThreadPoolExecutor(max_workers=len(active)) as pool:
+            batches = list(pool.map(search, active.keys(), active.values()))
+        return sorted((d for batch in batches for d in batch), key=lambda d: d.distance)
+
     def _build_message(self, query: str, docs: list[RetrievedDoc]) -> HumanMessage:
         """Construct a multimodal HumanMessage combining text and images."""
         content: list[dict] = []
@@ -0,0 +1,218 @@
+"""
+core/session_store.py
+Binds each UI session to its own ChromaDB collection so concurrent users
+never clear or query each other's index.  Idle sessions are evicted by TTL,
+and loaded collections are bounded by Chroma's LRU segment cache.
+"""
+
+from __future__ import annotations
+
+import re
+import shutil
+import threading
+import time
+from collections import OrderedDict
+
+import chromadb
+from chromadb.config import Settings
+
+from config import (
+    CHROMA_COLLECTION_NAME,
+    CHROMA_NUM_SHARDS,
+    CHROMA_PERSIST_DIR,
+    SESSION_MAX_COUNT,
+    SESSION_MAX_WARM,
+    SESSION_MEMORY_LIMIT_MB,
+    SESSION_TTL_SECONDS,
+)
+from core.compressed_store import CompressedVectorStore, open_vector_store
+from core.sharded_store import ShardedVectorStore
+from core.vector_store import ChromaVectorStore
+
+SessionVectorStore = ChromaVectorStore | CompressedVectorStore | ShardedVectorStore
+
+
+class SessionStoreManager:
+    """Hands out one lazily created vector store per session id.
+
+    With ``num_shards > 1`` each session gets a ``ShardedVectorStore`` whose
+    shards share one client per shard directory; otherwise a plain
+    ``ChromaVectorStore``.
+
+    Three limits apply:
+
+    * ``memory_limit_mb`` — the shared client runs Chroma's LRU segment
+      cache, which unloads the least recently used collections' indexes
+      once loaded segments exceed this budget; they reload from disk on
+      the next query.
+    * ``max_warm`` — ``ChromaVectorStore`` handles kept around; colder ones
+      are recreated on the next request.  This bounds Python objects only.
+    * ``max_sessions`` / ``ttl_seconds`` — sessions beyond the cap (least
+      recently used first) or idle for longer than the TTL have their
+      collection deleted.
+    """
+
+    def __init__(
+        self,
+        persist_directory: str = CHROMA_PERSIST_DIR,
+        collection_prefix: str = CHROMA_COLLECTION_NAME,
+        embedding_dim: int = 512,
+        max_warm: int = SESSION_MAX_WARM,
+        max_sessions: int = SESSION_MAX_COUNT,
+        ttl_seconds: float = SESSION_TTL_SECONDS,
+        purge_stale: bool = True,
+        memory_limit_mb: int = SESSION_MEMORY_LIMIT_MB,
+        num_shards: int = CHROMA_NUM_SHARDS,
+    ) -> None:
+        self.persist_directory = persist_directory
+        self.collection_prefix = collection_prefix
+        self.embedding_dim = embedding_dim
+        self.max_warm = max_warm
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.num_shards = num_shards
+
+        # One client per directory holding collections: the root, or each shard
+        self._directories = (
+            [ShardedVectorStore.shard_directory(persist_directory, i) for i in range(num_shards)]
+            if num_shards > 1 else [persist_directory]
+        )
+        # With sharding each client gets an equal share of the memory budget
+        settings = Settings(
+            anonymized_telemetry=False,
+            chroma_segment_cache_policy="LRU",
+            chroma_memory_limit_bytes=memory_limit_mb * 2**20 // len(self._directories),
+        )
+        self._clients = [
+            chromadb.PersistentClient(path=directory, settings=settings)
+            for directory in self._directories
+        ]
+        self._lock = threading.Lock()
+        # session_id → last access time, least recently used first
+        self._last_used: OrderedDict[str, float] = OrderedDict()
+        self._warm: OrderedDict[str, SessionVectorStore] = OrderedDict()
+
+        if purge_stale:
+            self._purge_stale_collections()
+
+    # ── public API ────────────────────────────────────────────────────────────
+    def get(
+        self, session_id: str, create: bool = True
+    ) -> SessionVectorStore | None:
+        """Return the session's store, creating its collection on first use.
+
+        Expired sessions are evicted first, so with ``create=False`` a session
+        idle past the TTL (or never seen) gives ``None`` instead of a fresh,
+        empty collection.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._evict_expired(now)
+            if not create and session_id not in self._last_used:
+                return None
+
+            self._last_used[session_id] = now
+            self._last_used.move_to_end(session_id)
+
+            store = self._warm.get(session_id)
+            if store is None:
+                store = self._open(self.collection_name(session_id))
+                self._warm[session_id] = store
+            self._warm.move_to_end(session_id)
+
+            while len(self._warm) > self.max_warm:
+                self._warm.popitem(last=False)
+            while len(self._last_used) > self.max_sessions:
+                oldest = next(iter(self._last_used))
+                self._drop(oldest)
+            return store
+
+    def open_shared(self, collection_name: str) -> SessionVectorStore:
+        """Open a collection shared by all sessions (never evicted or purged).
+
+        Sessions must treat it as read-only; only ``core.snapshot`` writes it.
+        """
+        if collection_name.startswith(f"{self.collection_prefix}_s_"):
+            raise ValueError(f"{collection_name!r} is reserved for session collections.")
+        return self._open(collection_name)
+
+    def release(self, session_id: str) -> None:
+        """Delete a session's collection immediately."""
+        with self._lock:
+            if session_id in self._last_used:
+                self._drop(session_id)
+
+    def evict_expired(self) -> list[str]:
+        """Delete collections of sessions idle for longer than the TTL."""
+        with self._lock:
+            return self._evict_expired(time.monotonic())
+
+    def collection_name(self, session_id: str) -> str:
+        # Chroma names: 3-63 chars of [a-zA-Z0-9._-], alphanumeric at both ends
+        safe_id = re.sub(r"[^a-zA-Z0-9]", "", session_id)[:32]
+        return f"{self.collection_prefix}_s_{safe_id}"
+
+    def __contains__(self, session_id: str) -> bool:
+        """Whether the session is live; expired sessions are evicted first."""
+        with self._lock:
+            self._evict_expired(time.monotonic())
+            return session_id in self._last_used
+
+    def __len__(self) -> int:
+        return len(self._last_used)
+
+    @property
+    def warm_count(self) -> int:
+        return len(self._warm)
+
+    # ── private helpers ───────────────────────────────────────────────────────
+    def _open(self, collection_name: str) -> SessionVectorStore:
+        if self.num_shards > 1:
+            return ShardedVectorStore(
+                persist_directory=self.persist_directory,
+                collection_name=collection_name,
+                embedding_dim=self.embedding_dim,
+                num_shards=self.num_shards,
+                clients=self._clients,
+            )
+        return open_vector_store(
+            persist_directory=self.persist_directory,
+            collection_name=collection_name,
+            embedding_dim=self.embedding_dim,
+            client=self._clients[0],
+        )
+
+    def _evict_expired(self, now: float) -> list[str]:
+        expired = [
+            session_id
+            for session_id, last_used in self._last_used.items()
+            if now - last_used > self.ttl_seconds
+        ]
+        for session_id in expired:
+            self._drop(session_id)
+        return expired
+
+    def _drop(self, session_id: str) -> None:
+        self._last_used.pop(session_id, None)
+        self._warm.pop(session_id, None)
+        name = self.collection_name(session_id)
+        for client, directory in zip(self._clients, self._directories):
+            try:
+                client.delete_collection(name)
+            except Exception:
+                pass  # never created or already gone
+            shutil.rmtree(
+                CompressedVectorStore.directory_for(directory, name), ignore_errors=True
+            )
+
+    def _purge_stale_collections(self) -> None:
+        """Remove session collections left behind by a previous process."""
+        prefix = f"{self.collection_prefix}_s_"
+        for client, directory in zip(self._clients, self._directories):
+            for collection in client.list_collections():
+                name = collection if isinstance(collection, str) else collection.name
+                if name.startswith(prefix):
+                    client.delete_collection(name)
+            vector_root = CompressedVectorStore.directory_for(directory, "")
+            for path in vector_root.glob(f"{prefix}*"):
+                shutil.rmtree(path, ignore_errors=True)
@@ -0,0 +1,212 @@
+"""
+core/sharded_store.py
+Spreads rows across several ChromaDB shards (one persist directory and
+HNSW index each) by hashing the row id or ``doc_id``, and fans queries out
+to all shards in parallel.  Drop-in replacement for ``ChromaVectorStore``.
+"""
+
+from __future__ import annotations
+
+import heapq
+import uuid
+import zlib
+from collections import defaultdict
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+from pathlib import Path
+from typing import Any
+
+import chromadb
+import numpy as np
+from langchain_core.documents import Document
+
+from config import (
+    CHROMA_COLLECTION_NAME,
+    CHROMA_NUM_SHARDS,
+    CHROMA_PERSIST_DIR,
+    CHROMA_SHARD_KEY,
+)
+from core.compressed_store import CompressedVectorStore, open_vector_store
+from core.vector_store import ChromaVectorStore, RetrievedDoc
+
+
+class ShardedVectorStore:
+    """N vector-store shards behind the single-store interface.
+
+    With ``shard_key="row"`` rows are routed by their id, so a session that
+    indexes a single document still uses every shard.  ``"doc_id"`` keeps a
+    document's chunks together instead, which only spreads load when the
+    collection holds many documents.  Writes to different shards and every
+    query run on a shared thread pool; per-shard top-k lists are merged by
+    distance.
+
+    Pass ``clients`` (one per shard) to share clients across stores.
+    """
+
+    def __init__(
+        self,
+        persist_directory: str = CHROMA_PERSIST_DIR,
+        collection_name: str = CHROMA_COLLECTION_NAME,
+        embedding_dim: int = 512,
+        num_shards: int = CHROMA_NUM_SHARDS,
+        shard_key: str = CHROMA_SHARD_KEY,
+        clients: list[chromadb.ClientAPI] | None = None,
+        **store_kwargs: Any,
+    ) -> None:
+        if num_shards < 1:
+            raise ValueError("num_shards must be at least 1.")
+        if shard_key not in ("row", "doc_id"):
+            raise ValueError(f"Unknown shard_key: {shard_key!r}")
+        if clients is not None and len(clients) != num_shards:
+            raise ValueError("Pass one client per shard.")
+        self.shard_key = shard_key
+        self.persist_directory = persist_directory
+        self.collection_name = collection_name
+        self.embedding_dim = embedding_dim
+
+        self.shards = [
+            open_vector_store(
+                persist_directory=self.shard_directory(persist_directory, i),
+                collection_name=collection_name,
+                embedding_dim=embedding_dim,
+                client=clients[i] if clients else None,
+                **store_kwargs,
+            )
+            for i in range(num_shards)
+        ]
+        self._pool = ThreadPoolExecutor(max_workers=num_shards)
+
+    @staticmethod
+    def shard_directory(persist_directory: str, shard: int) -> str:
+        return str(Path(persist_directory) / f"shard_{shard}")
+
+    # ── write ─────────────────────────────────────────────────────────────────
+    def add_documents(
+        self,
+        docs: list[Document],
+        embeddings: list[np.ndarray] | np.ndarray,
+        upsert: bool = False,
+    ) -> list[str]:
+        """Insert documents with their precomputed embeddings."""
+        if len(docs) != len(embeddings):
+            raise ValueError("docs and embeddings must have the same length.")
+        if not docs:
+            return []
+
+        return self.add_embeddings(
+            documents=[doc.page_content for doc in docs],
+            metadatas=[doc.metadata for doc in docs],
+            embeddings=np.stack(embeddings) if isinstance(embeddings, list) else embeddings,
+            upsert=upsert,
+        )
+
+    def add_embeddings(
+        self,
+        documents: list[str],
+        metadatas: list[dict[str, Any]],
+        embeddings: np.ndarray,
+        ids: list[str] | None = None,
+        upsert: bool = False,
+    ) -> list[str]:
+        """Route each row to its shard and write the shards in parallel."""
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if not (len(documents) == len(metadatas) == len(embeddings)):
+            raise ValueError("documents, metadatas and embeddings must have the same length.")
+        ids = ids or [str(uuid.uuid4()) for _ in documents]
+
+        rows: defaultdict[int, list[int]] = defaultdict(list)
+        for row, (row_id, metadata) in enumerate(zip(ids, metadatas)):
+            key = row_id if self.shard_key == "row" else metadata.get("doc_id", "")
+            rows[self.shard_for(key)].append(row)
+
+        def write(shard_idx: int, shard_rows: list[int]) -> list[str]:
+            return self.shards[shard_idx].add_embeddings(
+                documents=[documents[r] for r in shard_rows],
+                metadatas=[metadatas[r] for r in shard_rows],
+                embeddings=embeddings[shard_rows],
+                ids=[ids[r] for r in shard_rows],
+                upsert=upsert,
+            )
+
+        written = list(self._pool.map(write, rows.keys(), rows.values()))
+        out_ids = [""] * len(documents)
+        for shard_rows, shard_ids in zip(rows.values(), written):
+            for row, doc_id in zip(shard_rows, shard_ids):
+                out_ids[row] = doc_id
+        return out_ids
+
+    def clear(self) -> None:
+        """Clear every shard."""
+        list(self._pool.map(lambda shard: shard.clear(), self.shards))
+
+    def drop(self) -> None:
+        """Delete every shard's collection."""
+        list(self._pool.map(lambda shard: shard.drop(), self.shards))
+
+    def flush(self) -> None:
+        """Persist every shard's compressed index."""
+        list(self._pool.map(lambda shard: shard.flush(), self.shards))
+
+    def max_batch_size(self) -> int:
+        return min(shard.max_batch_size() for shard in self.shards)
+
+    # ── read ──────────────────────────────────────────────────────────────────
+    def similarity_search(
+        self,
+        query_embedding: np.ndarray,
+        k: int = 5,
+        where: dict[str, Any] | None = None,
+    ) -> list[RetrievedDoc]:
+        """Global top-k across all shards for a query embedding."""
+        return self.similarity_search_many(
+            np.asarray(query_embedding)[None, :], k=k, where=where
+        )[0]
+
+    def similarity_search_many(
+        self,
+        query_embeddings: np.ndarray,
+        k: int = 5,
+        where: dict[str, Any] | None = None,
+    ) -> list[list[RetrievedDoc]]:
+        """Query all shards in parallel and merge each row's hits by distance."""
+        query_embeddings = np.atleast_2d(query_embeddings)
+
+        def search(shard: ChromaVectorStore | CompressedVectorStore) -> list[list[RetrievedDoc]]:
+            if not shard.count():
+                return [[] for _ in range(len(query_embeddings))]
+            return shard.similarity_search_many(query_embeddings, k=k, where=where)
+
+        per_shard = list(self._pool.map(search, self.shards))
+        return [
+            heapq.nsmallest(k, chain.from_iterable(rows), key=lambda d: d.distance)
+            for rows in zip(*per_shard)
+        ]
+
+    def get_documents(self, ids: list[str]) -> list[RetrievedDoc]:
+        """Fetch documents by id from whichever shards hold them, in order."""
+        found = {
+            doc.id: doc
+            for docs in self._pool.map(lambda shard: shard.get_documents(ids), self.shards)
+            for doc in docs
+        }
+        return [found[doc_id] for doc_id in ids if doc_id in found]
+
+    def iter_embeddings(
+        self, batch_size: int = 4096
+    ) -> Iterator[tuple[list[str], np.ndarray]]:
+        for shard in self.shards:
+            yield from shard.iter_embeddings(batch_size)
+
+    def iter_records(
+        self, batch_size: int = 4096
+    ) -> Iterator[tuple[list[str], np.ndarray, list[str], list[dict[str, Any]]]]:
+        for shard in self.shards:
+            yield from shard.iter_records(batch_size)
+
+    def count(self) -> int:
+        return sum(shard.count() for shard in self.shards)
+
+    def shard_for(self, key: str) -> int:
+        """Stable shard index for a routing key (row id or ``doc_id``)."""
+        return zlib.crc32(str(key).encode()) % len(self.shards)
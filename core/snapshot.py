@@ -0,0 +1,262 @@
+"""
+core/snapshot.py
+Exports and imports self-contained index snapshots so a new replica can
+serve queries without re-running PDF parsing or CLIP inference.
+
+Bundle layout::
+
+    manifest.json     model name, embedding dim, chunking config, image index
+    embeddings.npy    contiguous float32 (n, dim) array
+    records.jsonl     one {"id", "document", "metadata"} object per row
+    images/           PNG payloads referenced by image_id
+
+Bundles are written to a staging directory and renamed into place, so a
+reader never sees a half-written one.
+
+Run:  python -m core.snapshot export --path ./snapshot --collection NAME
+      python -m core.snapshot import --path ./snapshot
+
+``import`` defaults to ``BASE_COLLECTION_NAME``, the shared read-only corpus
+the app offers to every session.
+
+Image payloads live in the app's memory, so a CLI export only carries them
+over from an earlier snapshot (``--images-from``); export from the app to
+include the current session's images.
+"""
+
+from __future__ import annotations
+
+import argparse
+import base64
+import json
+import shutil
+import time
+import uuid
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+from config import (
+    BASE_COLLECTION_NAME,
+    CHROMA_NUM_SHARDS,
+    CHUNK_OVERLAP,
+    CHUNK_SIZE,
+    CLIP_MODEL_NAME,
+)
+from core.compressed_store import CompressedVectorStore, open_vector_store
+from core.sharded_store import ShardedVectorStore
+from core.vector_store import ChromaVectorStore
+
+VectorStore = ChromaVectorStore | CompressedVectorStore | ShardedVectorStore
+
+SNAPSHOT_FORMAT_VERSION = 1
+
+
+def export_snapshot(
+    vector_store: VectorStore,
+    image_data_store: Mapping[str, str],
+    path: str | Path,
+    model_name: str = CLIP_MODEL_NAME,
+    chunk_size: int = CHUNK_SIZE,
+    chunk_overlap: int = CHUNK_OVERLAP,
+    batch_size: int = 4096,
+) -> dict[str, Any]:
+    """Write the store's contents and image payloads to a snapshot directory.
+
+    Embeddings are streamed page by page into a memory-mapped ``.npy`` file,
+    so the collection is never held in memory at once.  An existing bundle
+    at ``path`` is only replaced once the new one is complete.  Returns the
+    manifest.
+    """
+    path = Path(path)
+    staging = path.with_name(f".{path.name}.tmp-{uuid.uuid4().hex}")
+    try:
+        manifest = _write_bundle(
+            vector_store, image_data_store, staging,
+            model_name, chunk_size, chunk_overlap, batch_size,
+        )
+        _replace_dir(staging, path)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    return manifest
+
+
+def _write_bundle(
+    vector_store: VectorStore,
+    image_data_store: Mapping[str, str],
+    path: Path,
+    model_name: str,
+    chunk_size: int,
+    chunk_overlap: int,
+    batch_size: int,
+) -> dict[str, Any]:
+    (path / "images").mkdir(parents=True)
+
+    total = vector_store.count()
+    embeddings = np.lib.format.open_memmap(
+        path / "embeddings.npy",
+        mode="w+",
+        dtype=np.float32,
+        shape=(total, vector_store.embedding_dim),
+    )
+    row = 0
+    with open(path / "records.jsonl", "w", encoding="utf-8") as records:
+        for ids, embs, documents, metadatas in vector_store.iter_records(batch_size):
+            embeddings[row:row + len(ids)] = embs
+            row += len(ids)
+            for doc_id, document, metadata in zip(ids, documents, metadatas):
+                records.write(json.dumps(
+                    {"id": doc_id, "document": document, "metadata": metadata}
+                ) + "\n")
+    embeddings.flush()
+    del embeddings
+
+    images: dict[str, str] = {}
+    for i, (image_id, b64) in enumerate(image_data_store.items()):
+        filename = f"images/{i:06d}.png"
+        (path / filename).write_bytes(base64.b64decode(b64))
+        images[image_id] = filename
+
+    manifest = {
+        "format_version": SNAPSHOT_FORMAT_VERSION,
+        "clip_model": model_name,
+        "embedding_dim": vector_store.embedding_dim,
+        "chunk_size": chunk_size,
+        "chunk_overlap": chunk_overlap,
+        "count": row,
+        "created_at": time.time(),
+        "images": images,
+    }
+    (path / "manifest.json").write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+    return manifest
+
+
+def _replace_dir(staging: Path, path: Path) -> None:
+    """Rename a finished bundle into place, retiring any previous one."""
+    retired = None
+    if path.exists():
+        retired = path.with_name(f".{path.name}.old-{uuid.uuid4().hex}")
+        path.rename(retired)
+    staging.rename(path)
+    if retired is not None:
+        shutil.rmtree(retired, ignore_errors=True)
+
+
+def read_manifest(path: str | Path) -> dict[str, Any]:
+    manifest = json.loads((Path(path) / "manifest.json").read_text(encoding="utf-8"))
+    if manifest.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+        raise ValueError(
+            f"Unsupported snapshot format: {manifest.get('format_version')!r}"
+        )
+    return manifest
+
+
+def import_snapshot(
+    vector_store: VectorStore,
+    path: str | Path,
+    model_name: str | None = CLIP_MODEL_NAME,
+    clear: bool = True,
+    batch_size: int = 4096,
+) -> dict[str, str]:
+    """Bulk-load a snapshot into ``vector_store`` without any model inference.
+
+    Raises ``ValueError`` if the snapshot was built with a different CLIP
+    model (pass ``model_name=None`` to skip the check) or embedding size.
+    Returns the restored ``image_id → base64`` store.
+    """
+    path = Path(path)
+    manifest = read_manifest(path)
+    if model_name is not None and manifest["clip_model"] != model_name:
+        raise ValueError(
+            f"Snapshot was embedded with {manifest['clip_model']!r}, "
+            f"not {model_name!r}."
+        )
+    if manifest["embedding_dim"] != vector_store.embedding_dim:
+        raise ValueError(
+            f"Snapshot embedding_dim {manifest['embedding_dim']} does not match "
+            f"the store's {vector_store.embedding_dim}."
+        )
+
+    if clear:
+        vector_store.clear()
+
+    embeddings = np.load(path / "embeddings.npy", mmap_mode="r")
+    with open(path / "records.jsonl", encoding="utf-8") as records:
+        total = manifest["count"]
+        for start in range(0, total, batch_size):
+            n = min(batch_size, total - start)
+            batch = [json.loads(next(records)) for _ in range(n)]
+            vector_store.add_embeddings(
+                ids=[r["id"] for r in batch],
+                documents=[r["document"] for r in batch],
+                metadatas=[r["metadata"] for r in batch],
+                embeddings=embeddings[start:start + n],
+                upsert=True,
+            )
+    vector_store.flush()
+
+    return load_images(path)
+
+
+def load_images(path: str | Path) -> dict[str, str]:
+    """Return a snapshot's ``image_id → base64`` store."""
+    path = Path(path)
+    return {
+        image_id: base64.b64encode((path / filename).read_bytes()).decode()
+        for image_id, filename in read_manifest(path)["images"].items()
+    }
+
+
+def load_base_corpus(
+    vector_store: VectorStore, path: str | Path
+) -> dict[str, str]:
+    """Import ``path`` into the shared base store unless it is already there.
+
+    A replica pays for the bulk insert once, on first start; afterwards only
+    the image payloads are read back.  Returns the image store.
+    """
+    if vector_store.count() != read_manifest(path)["count"]:
+        return import_snapshot(vector_store, path)
+    return load_images(path)
+
+
+def _open_store(
+    collection_name: str, embedding_dim: int = 512
+) -> VectorStore:
+    if CHROMA_NUM_SHARDS > 1:
+        return ShardedVectorStore(collection_name=collection_name, embedding_dim=embedding_dim)
+    return open_vector_store(collection_name=collection_name, embedding_dim=embedding_dim)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export = commands.add_parser("export", help="write a collection to a snapshot")
+    export.add_argument("--path", required=True)
+    export.add_argument("--collection", default=BASE_COLLECTION_NAME)
+    export.add_argument("--images-from", help="snapshot whose image payloads to include")
+
+    load = commands.add_parser("import", help="bulk-load a snapshot into a collection")
+    load.add_argument("--path", required=True)
+    load.add_argument("--collection", default=BASE_COLLECTION_NAME)
+    load.add_argument("--append", action="store_true",
+                      help="keep the collection's existing rows")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        store = _open_store(args.collection)
+        images = load_images(args.images_from) if args.images_from else {}
+        manifest = export_snapshot(store, images, args.path)
+        print(f"Exported {manifest['count']} rows and {len(images)} images to {args.path}")
+    else:
+        manifest = read_manifest(args.path)
+        store = _open_store(args.collection, manifest["embedding_dim"])
+        images = import_snapshot(store, args.path, clear=not args.append)
+        print(f"Imported {store.count()} rows and {len(images)} images into {args.collection}")
+
+
+if __name__ == "__main__":
+    main()
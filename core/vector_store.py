@@ -7,6 +7,7 @@ document metadata.  Replaces the FAISS vector store from the original notebook.
 from __future__ import annotations
 
 import uuid
+from collections.abc import Iterator
 from dataclasses import dataclass, field
 from typing import Any
 
@@ -15,7 +16,13 @@ import numpy as np
 from chromadb.config import Settings
 from langchain_core.documents import Document
 
-from config import CHROMA_COLLECTION_NAME, CHROMA_PERSIST_DIR
+from config import (
+    CHROMA_COLLECTION_NAME,
+    CHROMA_PERSIST_DIR,
+    HNSW_CONSTRUCTION_EF,
+    HNSW_M,
+    HNSW_SEARCH_EF,
+)
 
 
 @dataclass
@@ -25,6 +32,27 @@ class RetrievedDoc:
     page_content: str
     metadata: dict[str, Any]
     distance: float = 0.0
+    id: str = ""
+
+
+def build_where(
+    type: str | None = None,
+    page: int | None = None,
+    doc_id: str | None = None,
+    **metadata: Any,
+) -> dict[str, Any] | None:
+    """Build a Chroma ``where`` filter from equality constraints.
+
+    Values may also be Chroma operator dicts, e.g. ``page={"$gte": 3}``.
+    Returns ``None`` when no constraint is given.
+    """
+    clauses = {"type": type, "page": page, "doc_id": doc_id, **metadata}
+    terms = [{key: value} for key, value in clauses.items() if value is not None]
+    if not terms:
+        return None
+    if len(terms) == 1:
+        return terms[0]
+    return {"$and": terms}
 
 
 class ChromaVectorStore:
@@ -35,48 +63,104 @@ class ChromaVectorStore:
         persist_directory: str = CHROMA_PERSIST_DIR,
         collection_name: str = CHROMA_COLLECTION_NAME,
         embedding_dim: int = 512,
+        client: chromadb.ClientAPI | None = None,
+        hnsw_construction_ef: int = HNSW_CONSTRUCTION_EF,
+        hnsw_search_ef: int = HNSW_SEARCH_EF,
+        hnsw_m: int = HNSW_M,
     ) -> None:
         self.persist_directory = persist_directory
         self.collection_name = collection_name
         self.embedding_dim = embedding_dim
+        self.collection_metadata = {
+            "hnsw:space": "cosine",
+            "hnsw:construction_ef": hnsw_construction_ef,
+            "hnsw:search_ef": hnsw_search_ef,
+            "hnsw:M": hnsw_m,
+        }
 
-        self._client = chromadb.PersistentClient(
+        # A shared client lets many collections live in one persist directory
+        self._client = client or chromadb.PersistentClient(
             path=persist_directory,
             settings=Settings(anonymized_telemetry=False),
         )
         self._collection = self._client.get_or_create_collection(
             name=collection_name,
-            metadata={"hnsw:space": "cosine"},
+            metadata=self.collection_metadata,
         )
 
     # ── write ─────────────────────────────────────────────────────────────────
     def add_documents(
         self,
         docs: list[Document],
-        embeddings: list[np.ndarray],
-    ) -> None:
+        embeddings: list[np.ndarray] | np.ndarray,
+        upsert: bool = False,
+    ) -> list[str]:
         """Insert documents with their precomputed embeddings."""
         if len(docs) != len(embeddings):
             raise ValueError("docs and embeddings must have the same length.")
+        if not docs:
+            return []
 
-        ids = [str(uuid.uuid4()) for _ in docs]
-        documents = [doc.page_content for doc in docs]
-        metadatas = [doc.metadata for doc in docs]
-        embedding_list = [emb.tolist() for emb in embeddings]
-
-        self._collection.add(
-            ids=ids,
-            documents=documents,
-            metadatas=metadatas,
-            embeddings=embedding_list,
+        return self.add_embeddings(
+            documents=[doc.page_content for doc in docs],
+            metadatas=[doc.metadata for doc in docs],
+            embeddings=np.stack(embeddings) if isinstance(embeddings, list) else embeddings,
+            upsert=upsert,
         )
 
+    def add_embeddings(
+        self,
+        documents: list[str],
+        metadatas: list[dict[str, Any]],
+        embeddings: np.ndarray,
+        ids: list[str] | None = None,
+        upsert: bool = False,
+    ) -> list[str]:
+        """Bulk write path: a contiguous ``(n, dim)`` array, split into batches.
+
+        Embeddings are handed to Chroma as array rows rather than lists of
+        Python floats, and each call stays within the client's max batch size.
+        Returns the ids written.
+        """
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if embeddings.ndim != 2 or embeddings.shape[1] != self.embedding_dim:
+            raise ValueError(f"Expected embeddings of shape (n, {self.embedding_dim}).")
+        if not (len(documents) == len(metadatas) == len(embeddings)):
+            raise ValueError("documents, metadatas and embeddings must have the same length.")
+        ids = ids or [str(uuid.uuid4()) for _ in documents]
+
+        write = self._collection.upsert if upsert else self._collection.add
+        batch_size = self.max_batch_size()
+        for start in range(0, len(ids), batch_size):
+            end = start + batch_size
+            write(
+                ids=ids[start:end],
+                documents=documents[start:end],
+                metadatas=metadatas[start:end],
+                embeddings=embeddings[start:end],
+            )
+        return ids
+
+    def flush(self) -> None:
+        """Nothing to persist: Chroma writes through on every call."""
+
+    def max_batch_size(self) -> int:
+        """Largest number of records the client accepts in one write."""
+        getter = getattr(self._client, "get_max_batch_size", None)
+        if getter is not None:
+            return getter()
+        return getattr(self._client, "max_batch_size", 5461)
+
+    def drop(self) -> None:
+        """Delete the collection permanently without recreating it."""
+        self._client.delete_collection(self.collection_name)
+
     def clear(self) -> None:
         """Delete and recreate the collection (useful between sessions)."""
         self._client.delete_collection(self.collection_name)
         self._collection = self._client.get_or_create_collection(
             name=self.collection_name,
-            metadata={"hnsw:space": "cosine"},
+            metadata=self.collection_metadata,
         )
 
     # ── read ──────────────────────────────────────────────────────────────────
@@ -84,22 +168,91 @@ class ChromaVectorStore:
         self,
         query_embedding: np.ndarray,
         k: int = 5,
+        where: dict[str, Any] | None = None,
     ) -> list[RetrievedDoc]:
-        """Return the top-k most similar documents for a query embedding."""
+        """Return the top-k most similar documents for a query embedding.
+
+        Args:
+            where: Optional Chroma metadata filter (see ``build_where``),
+                applied inside the query rather than after it.
+        """
+        return self.similarity_search_many(
+            np.asarray(query_embedding)[None, :], k=k, where=where
+        )[0]
+
+    def similarity_search_many(
+        self,
+        query_embeddings: np.ndarray,
+        k: int = 5,
+        where: dict[str, Any] | None = None,
+    ) -> list[list[RetrievedDoc]]:
+        """Top-k search for a ``(Q, dim)`` matrix of queries in one query call.
+
+        Returns one result list per query row.
+        """
+        query_embeddings = np.ascontiguousarray(query_embeddings, dtype=np.float32)
+
         results = self._collection.query(
-            query_embeddings=[query_embedding.tolist()],
+            query_embeddings=query_embeddings,
             n_results=min(k, self._collection.count() or 1),
+            where=where,
             include=["documents", "metadatas", "distances"],
         )
 
-        retrieved: list[RetrievedDoc] = []
-        for doc, meta, dist in zip(
-            results["documents"][0],
-            results["metadatas"][0],
-            results["distances"][0],
+        retrieved: list[list[RetrievedDoc]] = []
+        for ids, docs, metas, dists in zip(
+            results["ids"],
+            results["documents"],
+            results["metadatas"],
+            results["distances"],
         ):
-            retrieved.append(RetrievedDoc(page_content=doc, metadata=meta, distance=dist))
+            retrieved.append([
+                RetrievedDoc(page_content=doc, metadata=meta, distance=dist, id=doc_id)
+                for doc_id, doc, meta, dist in zip(ids, docs, metas, dists)
+            ])
         return retrieved
 
+    def get_documents(self, ids: list[str]) -> list[RetrievedDoc]:
+        """Fetch documents by id, in the given order (missing ids are skipped)."""
+        if not ids:
+            return []
+        results = self._collection.get(ids=ids, include=["documents", "metadatas"])
+        by_id = {
+            doc_id: RetrievedDoc(page_content=doc, metadata=meta, id=doc_id)
+            for doc_id, doc, meta in zip(
+                results["ids"], results["documents"], results["metadatas"]
+            )
+        }
+        return [by_id[doc_id] for doc_id in ids if doc_id in by_id]
+
+    def iter_embeddings(
+        self, batch_size: int = 4096
+    ) -> Iterator[tuple[list[str], np.ndarray]]:
+        """Yield ``(ids, embeddings)`` pages covering the whole collection."""
+        for page in self._iter_pages(["embeddings"], batch_size):
+            yield page["ids"], np.asarray(page["embeddings"], dtype=np.float32)
+
+    def iter_records(
+        self, batch_size: int = 4096
+    ) -> Iterator[tuple[list[str], np.ndarray, list[str], list[dict[str, Any]]]]:
+        """Yield ``(ids, embeddings, documents, metadatas)`` pages."""
+        for page in self._iter_pages(["embeddings", "documents", "metadatas"], batch_size):
+            yield (
+                page["ids"],
+                np.asarray(page["embeddings"], dtype=np.float32),
+                page["documents"],
+                page["metadatas"],
+            )
+
     def count(self) -> int:
-        return self._collection.count()
\ No newline at end of file
+        return self._collection.count()
+
+    # ── private helpers ───────────────────────────────────────────────────────
+    def _iter_pages(self, include: list[str], batch_size: int) -> Iterator[dict[str, Any]]:
+        offset = 0
+        while True:
+            page = self._collection.get(include=include, limit=batch_size, offset=offset)
+            if not page["ids"]:
+                return
+            yield page
+            offset += len(page["ids"])